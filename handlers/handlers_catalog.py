@@ -9,15 +9,31 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.exceptions import TelegramBadRequest
 
 # --- Внутренние модули ---
-from services.config import get_target_display_local, PURCHASE_COOLDOWN
+from services.config import get_target_display_local, PURCHASE_COOLDOWN, purchase_lock
 from services.menu import update_menu
 from services.gifts_bot import get_filtered_gifts
 from services.buy_bot import buy_gift
 from services.buy_userbot import buy_gift_userbot
 from services.balance import refresh_balance
+from utils.misc import is_command
 
 wizard_router = Router()
 
+# Статичные клавиатуры каталога собираются один раз
+CATALOG_SENDER_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="🤖 Бот", callback_data="catalog_sender_bot"),
+        InlineKeyboardButton(text="👤 Юзербот", callback_data="catalog_sender_userbot"),
+    ],
+    [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_purchase")]
+])
+CATALOG_CONFIRM_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_purchase"),
+        InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_purchase"),
+    ]
+])
+
 class CatalogFSM(StatesGroup):
     """
     Состояния для FSM каталога подарков.
@@ -111,7 +127,7 @@ async def on_gift_selected(call: CallbackQuery, state: FSMContext):
     """
     Хендлер выбора подарка из каталога. Запрашивает у пользователя количество для покупки.
     """
-    gift_id = call.data.split("_")[-1]
+    gift_id = call.data.removeprefix("catalog_gift_")
     data = await state.get_data()
     gifts = data.get("gifts_catalog", [])
     if not gifts:
@@ -200,20 +216,11 @@ async def on_recipient_entered(message: Message, state: FSMContext):
         target_chat_id=target_chat_id
     )
 
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="🤖 Бот", callback_data="catalog_sender_bot"),
-                InlineKeyboardButton(text="👤 Юзербот", callback_data="catalog_sender_userbot"),
-            ],
-            [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_purchase")]
-        ]
-    )
     message_text = ("📤 Выберите <b>отправителя</b> подарков:\n\n"
                     "🤖 <code>Бот</code> - покупки с баланса бота\n"
                     "👤 <code>Юзербот</code> - покупки с баланса юзербота\n\n"
                     "/cancel — отменить")
-    await message.answer(message_text, reply_markup=kb)
+    await message.answer(message_text, reply_markup=CATALOG_SENDER_KB)
     await state.set_state(CatalogFSM.waiting_sender)
 
 
@@ -236,15 +243,6 @@ async def on_catalog_sender_selected(call: CallbackQuery, state: FSMContext):
 
     gift_display = f"{gift['left']:,} из {gift['supply']:,}" if gift.get("supply") is not None else gift.get("emoji")
 
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_purchase"),
-                InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_purchase"),
-            ]
-        ]
-    )
-
     recipient_display = get_target_display_local(target_user_id, target_chat_id, call.from_user.id)
 
     await call.message.edit_text(
@@ -254,7 +252,7 @@ async def on_catalog_sender_selected(call: CallbackQuery, state: FSMContext):
         f"💰 Общая сумма: <b>★{total:,}</b>\n"
         f"👤 Получатель: {recipient_display}\n"
         f"📤 Отправитель: {'🤖 Бот' if sender == 'bot' else '👤 Юзербот'}",
-        reply_markup=kb
+        reply_markup=CATALOG_CONFIRM_KB
     )
 
     await state.set_state(CatalogFSM.waiting_confirm)
@@ -282,33 +280,36 @@ async def confirm_purchase(call: CallbackQuery, state: FSMContext):
 
     bought = 0
     while bought < qty:
-        if sender == 'bot':
-            success = await buy_gift(
-                bot=call.bot,
-                env_user_id=call.from_user.id,
-                gift_id=gift_id,
-                user_id=data_target_user_id,
-                chat_id=data_target_chat_id,
-                gift_price=gift_price,
-                file_id=None
-            )
-        elif sender == 'userbot':
-            success = await buy_gift_userbot(
-                session_user_id=call.from_user.id,
-                gift_id=gift_id,
-                target_user_id=data_target_user_id,
-                target_chat_id=data_target_chat_id,
-                gift_price=gift_price,
-                file_id=None
-            )
-        else:
-            success = False
+        # Общая с воркером очередь покупок: баланс проверяется и списывается без гонок
+        async with purchase_lock:
+            if sender == 'bot':
+                success = await buy_gift(
+                    bot=call.bot,
+                    env_user_id=call.from_user.id,
+                    gift_id=gift_id,
+                    user_id=data_target_user_id,
+                    chat_id=data_target_chat_id,
+                    gift_price=gift_price,
+                    file_id=None
+                )
+            elif sender == 'userbot':
+                success = await buy_gift_userbot(
+                    session_user_id=call.from_user.id,
+                    gift_id=gift_id,
+                    target_user_id=data_target_user_id,
+                    target_chat_id=data_target_chat_id,
+                    gift_price=gift_price,
+                    file_id=None
+                )
+            else:
+                success = False
+            if success:
+                await asyncio.sleep(PURCHASE_COOLDOWN)
 
         if not success:
             break
 
         bought += 1
-        await asyncio.sleep(PURCHASE_COOLDOWN)
 
     if bought == qty:
         await call.message.answer(f"✅ Покупка <b>{gift_display}</b> успешно завершена!\n"
@@ -327,7 +328,7 @@ async def confirm_purchase(call: CallbackQuery, state: FSMContext):
     await update_menu(bot=call.bot, chat_id=call.message.chat.id, user_id=call.from_user.id, message_id=call.message.message_id)
 
 
-@wizard_router.callback_query(lambda c: c.data == "cancel_purchase")
+@wizard_router.callback_query(F.data == "cancel_purchase")
 async def cancel_callback(call: CallbackQuery, state: FSMContext):
     """
     Отмена покупки подарка на этапе подтверждения.
@@ -343,7 +344,7 @@ async def try_cancel(message: Message, state: FSMContext) -> bool:
     Универсальная функция для обработки отмены любого шага с помощью /cancel.
     Очищает состояние, возвращает True если была отмена.
     """
-    if message.text and message.text.strip().lower() == "/cancel":
+    if is_command(message.text, "/cancel"):
         await state.clear()
         await message.answer("🚫 Действие отменено.")
         await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=message.from_user.id, message_id=message.message_id)
@@ -1,21 +1,88 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+from collections import defaultdict
+
 # --- Сторонние библиотеки ---
 from aiogram import F
 from aiogram.filters import CommandStart
+from aiogram.enums import ParseMode
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, Message
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 
 # --- Внутренние модули ---
-from services.config import get_valid_config, save_config, format_config_summary, get_target_display, ALLOWED_USER_IDS
-from services.menu import update_menu, config_action_keyboard 
+from services.config import get_valid_config, save_config, notify_config_changed, purchase_lock, format_config_summary, get_target_display, ALLOWED_USER_IDS
+from services.menu import update_menu, edit_to_menu, refresh_menu_in_place, config_action_keyboard, CB
 from services.balance import refresh_balance
 from services.buy_bot import buy_gift
 from middlewares.access_control import show_guest_menu
+from middlewares.outgoing_throttle import non_critical
+
+logger = logging.getLogger(__name__)
+
+# Текст справки собирается один раз; меняются только версия, username бота и получатель
+HELP_TEMPLATE = (
+    "<b>🛠 Управление ботом <code>v{version}</code> :</b>\n\n"
+    "<b>🟢 Включить / 🔴 Выключить</b> — запускает или останавливает покупки.\n"
+    "<b>✏️ Профили</b> — Добавление и удаление профилей с конфигурациями для покупки подарков.\n"
+    "<b>♻️ Сбросить</b> — обнуляет количество уже купленных подарков для всех профилей, чтобы не создавать снова такие же профили.\n"
+    "<b>⚙️ Юзербот</b> — управление сессией Telegram-аккаунта.\n"
+    "<b>💰 Пополнить</b> — депозит звёзд в бот.\n"
+    "<b>↩️ Вывести</b> — возврат звёзд по ID транзакции или вывести все звёзды сразу по команде /withdraw_all.\n"
+    "<b>🎏 Каталог</b> — список доступных к покупке подарков в маркете.\n\n"
+    "<b>📌 Подсказки:</b>\n\n"
+    "❗️ Если получатель подарка — другой пользователь, он должен зайти в этот бот <code>@{bot_username}</code> и нажать <code>/start</code>.\n"
+    "❗️ Получатель подарка <b>аккаунт</b> — пишите <b>id</b> пользователя (узнать id можно тут @userinfobot).\n"
+    "❗️ Получатель подарка <b>канал</b> — пишите <b>username</b> канала.\n"
+    "❗️ Если подарок отправляется <b>через Юзербота</b>, указывайте <b>только username</b> получателя — независимо от того, это пользователь или канал.\n"
+    "❗️ Чтобы аккаунт <b>Юзербота</b> отправил подарок на другой аккаунт, между аккаунтами должна быть переписка.\n"
+    "❗️ Чтобы пополнить баланс бота с любого аккаунта, зайдите в этот бот <code>@{bot_username}</code> и нажмите <code>/start</code>, чтобы вызвать меню пополнения.\n"
+    "❗️ Как посмотреть <b>ID транзакции</b> для возврата звёзд?  Нажмите на сообщение об оплате в чате с ботом и там будет ID транзакции.\n"
+    "❗️ Хотите протестировать бот? Купите подарок 🧸 за ★15 c баланса бота, получатель {target_display}.\n\n"
+    "<b>🐸 Автор: @kirill_nft</b>\n"
+    "<b>📢 Канал: @WyoxAutoBuy</b>"
+)
 
-def register_main_handlers(dp, bot, version):
+
+def register_main_handlers(dp, bot, version, bot_username):
     """
     Регистрирует основные хендлеры для главного меню, стартовых и управляющих команд.
+    Username бота запрашивается один раз при старте и передаётся сюда.
     """
+    # Версия и username статичны — подставляем их сразу, на каждый клик остаётся только получатель
+    help_template = HELP_TEMPLATE.format(
+        version=version,
+        bot_username=bot_username,
+        target_display="{target_display}"
+    )
+    help_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Тест? Купить 🧸 за ★15", callback_data=CB.BUY_TEST)],
+        [InlineKeyboardButton(text="☰ Меню", callback_data=CB.MAIN_MENU)]
+    ])
+    userbot_help_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="⚙️ Юзербот", callback_data="userbot_menu"),
+        InlineKeyboardButton(text="☰ Меню", callback_data="userbot_main_menu")
+    ]])
+
+    # Блокировка на пользователя: чтение-изменение-запись конфига без потерянных обновлений
+    user_locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+    # Пользователи, у которых сейчас выполняется тестовая покупка
+    buying: set[int] = set()
+
+    async def render_menu(call: CallbackQuery, config: dict):
+        """
+        Перерисовывает меню в сообщении колбэка.
+        Неизменившееся меню Telegram отклоняет ошибкой "message is not modified" — она не считается сбоем.
+        """
+        try:
+            await call.message.edit_text(
+                format_config_summary(config, call.from_user.id),
+                reply_markup=config_action_keyboard(config["ACTIVE"])
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
 
     @dp.message(CommandStart())
     async def command_status_handler(message: Message, state: FSMContext):
@@ -27,20 +94,18 @@ def register_main_handlers(dp, bot, version):
             await show_guest_menu(message)
             return
         
-        await state.clear()
-        await refresh_balance(bot)
+        await asyncio.gather(state.clear(), refresh_balance(bot))
         await update_menu(bot=bot, chat_id=message.chat.id, user_id=message.from_user.id, message_id=message.message_id)
 
 
-    @dp.callback_query(F.data == "main_menu")
+    @dp.callback_query(F.data == CB.MAIN_MENU)
     async def start_callback(call: CallbackQuery, state: FSMContext):
         """
         Показывает главное меню по нажатию кнопки "Меню".
         Очищает все состояния FSM для пользователя.
         """
+        asyncio.create_task(call.answer())
         await state.clear()
-        await call.answer()
-        config = await get_valid_config(call.from_user.id)
         await refresh_balance(call.bot)
         await update_menu(
             bot=call.bot,
@@ -50,48 +115,23 @@ def register_main_handlers(dp, bot, version):
         )
 
 
-    @dp.callback_query(F.data == "show_help")
+    @dp.callback_query(F.data == CB.HELP)
     async def help_callback(call: CallbackQuery):
         """
         Показывает подробную справку по работе с ботом.
         """
+        asyncio.create_task(call.answer())
         config = await get_valid_config(call.from_user.id)
         # По умолчанию первый профиль
         profile = config["PROFILES"][0]
         target_display = get_target_display(profile, call.from_user.id)
-        bot_info = await call.bot.get_me()
-        bot_username = bot_info.username
-        help_text = (
-            f"<b>🛠 Управление ботом <code>v{version}</code> :</b>\n\n"
-            "<b>🟢 Включить / 🔴 Выключить</b> — запускает или останавливает покупки.\n"
-            "<b>✏️ Профили</b> — Добавление и удаление профилей с конфигурациями для покупки подарков.\n"
-            "<b>♻️ Сбросить</b> — обнуляет количество уже купленных подарков для всех профилей, чтобы не создавать снова такие же профили.\n"
-            "<b>⚙️ Юзербот</b> — управление сессией Telegram-аккаунта.\n"
-            "<b>💰 Пополнить</b> — депозит звёзд в бот.\n"
-            "<b>↩️ Вывести</b> — возврат звёзд по ID транзакции или вывести все звёзды сразу по команде /withdraw_all.\n"
-            "<b>🎏 Каталог</b> — список доступных к покупке подарков в маркете.\n\n"
-            "<b>📌 Подсказки:</b>\n\n"
-            f"❗️ Если получатель подарка — другой пользователь, он должен зайти в этот бот <code>@{bot_username}</code> и нажать <code>/start</code>.\n"
-            "❗️ Получатель подарка <b>аккаунт</b> — пишите <b>id</b> пользователя (узнать id можно тут @userinfobot).\n"
-            "❗️ Получатель подарка <b>канал</b> — пишите <b>username</b> канала.\n"
-            "❗️ Если подарок отправляется <b>через Юзербота</b>, указывайте <b>только username</b> получателя — независимо от того, это пользователь или канал.\n"
-            "❗️ Чтобы аккаунт <b>Юзербота</b> отправил подарок на другой аккаунт, между аккаунтами должна быть переписка.\n"
-            f"❗️ Чтобы пополнить баланс бота с любого аккаунта, зайдите в этот бот <code>@{bot_username}</code> и нажмите <code>/start</code>, чтобы вызвать меню пополнения.\n"
-            "❗️ Как посмотреть <b>ID транзакции</b> для возврата звёзд?  Нажмите на сообщение об оплате в чате с ботом и там будет ID транзакции.\n"
-            f"❗️ Хотите протестировать бот? Купите подарок 🧸 за ★15 c баланса бота, получатель {target_display}.\n\n"
-            "<b>🐸 Автор: @kirill_nft</b>\n"
-            "<b>📢 Канал: @WyoxAutoBuy</b>"
-        )
-        button = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Тест? Купить 🧸 за ★15", callback_data="buy_test_gift")],
-            [InlineKeyboardButton(text="☰ Меню", callback_data="main_menu")]
-        ])
-        await call.answer()
-        await call.message.answer(help_text, reply_markup=button)
+        help_text = help_template.format(target_display=target_display)
+        await call.message.answer(help_text, reply_markup=help_keyboard, parse_mode=ParseMode.HTML)
 
     
     @dp.callback_query(F.data == "show_userbot_help")
     async def userbot_help_callback(call: CallbackQuery):
+        asyncio.create_task(call.answer())
         help_text = (
             "🔐 <b>Как получить api_id и api_hash для Telegram аккаунта:</b>\n\n"
             "┌1️⃣ Перейдите на сайт: <a href=\"https://my.telegram.org\">https://my.telegram.org</a>\n"
@@ -108,88 +148,96 @@ def register_main_handlers(dp, bot, version):
             "📍 Нельзя подключить юзербот от того же аккаунта, с которого вы управляете этим ботом. Используйте для юзербота отдельный аккаунт (твинк).\n\n"
             "⚠️ Не передавайтe <b>api_id</b> и <b>api_hash</b> другим людям!"
         )
-        button = InlineKeyboardMarkup(inline_keyboard=[[
-            InlineKeyboardButton(text="⚙️ Юзербот", callback_data="userbot_menu"),
-            InlineKeyboardButton(text="☰ Меню", callback_data="userbot_main_menu")
-        ]])
-        await call.answer()
-        await call.message.answer(help_text, reply_markup=button, disable_web_page_preview=True)
+        await call.message.answer(help_text, reply_markup=userbot_help_keyboard, disable_web_page_preview=True)
 
 
-    @dp.callback_query(F.data == "buy_test_gift")
+    @dp.callback_query(F.data == CB.BUY_TEST)
     async def buy_test_gift(call: CallbackQuery):
         """
         Покупка тестового подарка для проверки работы бота.
         """
-        gift_id = '5170233102089322756'
-        config = await get_valid_config(call.from_user.id)
-        # Используем первый профиль по умолчанию
-        profile = config["PROFILES"][0]
-        TARGET_USER_ID = profile["TARGET_USER_ID"]
-        TARGET_CHAT_ID = profile["TARGET_CHAT_ID"]
-        target_display = get_target_display(profile, call.from_user.id)
-
-        success = await buy_gift(
-            bot=call.bot,
-            env_user_id=call.from_user.id,
-            gift_id=gift_id,
-            user_id=TARGET_USER_ID,
-            chat_id=TARGET_CHAT_ID,
-            gift_price=15,
-            file_id=None
-        )
-        if not success:
-            await call.answer()
-            await call.message.answer("⚠️ Покупка подарка 🧸 за ★15 невозможна.\n"
-                                      "💰 Пополните баланс! Проверьте адрес получателя!\n"
-                                      "🚦 Статус изменён на 🔴 (неактивен).")
-            await update_menu(bot=bot, chat_id=call.message.chat.id, user_id=call.from_user.id, message_id=call.message.message_id)
+        user_id = call.from_user.id
+        # Повторное нажатие, пока идёт покупка, не должно запускать вторую покупку
+        if user_id in buying:
+            await call.answer("⏳ Уже обрабатывается")
             return
+        asyncio.create_task(call.answer())
+        buying.add(user_id)
+        try:
+            gift_id = '5170233102089322756'
+            config = await get_valid_config(call.from_user.id)
+            # Используем первый профиль по умолчанию
+            profile = config["PROFILES"][0]
+            TARGET_USER_ID = profile["TARGET_USER_ID"]
+            TARGET_CHAT_ID = profile["TARGET_CHAT_ID"]
+            target_display = get_target_display(profile, call.from_user.id)
+
+            async with purchase_lock:
+                success = await buy_gift(
+                    bot=call.bot,
+                    env_user_id=call.from_user.id,
+                    gift_id=gift_id,
+                    user_id=TARGET_USER_ID,
+                    chat_id=TARGET_CHAT_ID,
+                    gift_price=15,
+                    file_id=None
+                )
+            if success:
+                notice = f"✅ Подарок 🧸 за ★15 куплен. Получатель: {target_display}."
+            else:
+                notice = ("⚠️ Покупка подарка 🧸 за ★15 невозможна.\n"
+                          "💰 Пополните баланс! Проверьте адрес получателя!\n"
+                          "🚦 Статус изменён на 🔴 (неактивен).")
 
-        await call.answer()
-        await call.message.answer(f"✅ Подарок 🧸 за ★15 куплен. Получатель: {target_display}.")
-        await update_menu(bot=bot, chat_id=call.message.chat.id, user_id=call.from_user.id, message_id=call.message.message_id)
+            # Одно редактирование вместо отдельного уведомления и пересылки меню
+            config = await get_valid_config(call.from_user.id)
+            text = f"{notice}\n\n{format_config_summary(config, call.from_user.id)}"
+            if not await edit_to_menu(call.message, config, text):
+                await call.message.answer(notice)
+                await update_menu(bot=bot, chat_id=call.message.chat.id, user_id=call.from_user.id, message_id=call.message.message_id)
+        finally:
+            buying.discard(user_id)
 
 
-    @dp.callback_query(F.data == "reset_bought")
+    @dp.callback_query(F.data == CB.RESET)
     async def reset_bought_callback(call: CallbackQuery):
         """
         Сброс счетчиков купленных подарков и статусов выполнения по всем профилям.
         """
-        config = await get_valid_config(call.from_user.id)
-        # Сбросить счетчики во всех профилях
-        for profile in config["PROFILES"]:
-            profile["BOUGHT"] = 0
-            profile["SPENT"] = 0
-            profile["DONE"] = False
-        config["ACTIVE"] = False
-        await save_config(config)
-        info = format_config_summary(config, call.from_user.id)
-        try:
-            await call.message.edit_text(
-                info,
-                reply_markup=config_action_keyboard(config["ACTIVE"])
+        async with user_locks[call.from_user.id]:
+            config = await get_valid_config(call.from_user.id)
+            # Если сбрасывать нечего — не трогаем файл и не редактируем меню
+            dirty = config.get("ACTIVE") or any(
+                profile.get("BOUGHT") or profile.get("SPENT") or profile.get("DONE")
+                for profile in config["PROFILES"]
             )
-        except TelegramBadRequest as e:
-            if "message is not modified" not in str(e):
-                raise
+            if dirty:
+                # Сбросить счетчики во всех профилях
+                for profile in config["PROFILES"]:
+                    profile.update(BOUGHT=0, SPENT=0, DONE=False)
+                config["ACTIVE"] = False
+                await save_config(config)
+                notify_config_changed()
+
+        if not dirty:
+            await call.answer("Уже сброшено.")
+            return
         await call.answer("Счётчик покупок сброшен.")
+        await render_menu(call, config)
 
 
-    @dp.callback_query(F.data == "toggle_active")
+    @dp.callback_query(F.data == CB.TOGGLE)
     async def toggle_active_callback(call: CallbackQuery):
         """
         Переключение статуса работы бота: активен/неактивен.
         """
-        config = await get_valid_config(call.from_user.id)
-        config["ACTIVE"] = not config.get("ACTIVE", False)
-        await save_config(config)
-        info = format_config_summary(config, call.from_user.id)
-        await call.message.edit_text(
-            info,
-            reply_markup=config_action_keyboard(config["ACTIVE"])
-        )
         await call.answer("Статус обновлён")
+        async with user_locks[call.from_user.id]:
+            config = await get_valid_config(call.from_user.id)
+            config["ACTIVE"] = not config.get("ACTIVE", False)
+            await save_config(config)
+            notify_config_changed()
+        await render_menu(call, config)
 
 
     @dp.pre_checkout_query()
@@ -200,6 +248,20 @@ def register_main_handlers(dp, bot, version):
         await pre_checkout_query.answer(ok=True)
 
 
+    async def post_payment_refresh(chat_id: int, user_id: int, message_id: int):
+        """
+        Обновляет баланс и меню после успешной оплаты.
+        """
+        try:
+            await refresh_balance(bot)
+            # Пополненный баланс может разблокировать покупки
+            notify_config_changed()
+            with non_critical():
+                await refresh_menu_in_place(bot=bot, chat_id=chat_id, user_id=user_id, message_id=message_id)
+        except Exception as e:
+            logger.error(f"Не удалось обновить меню после оплаты: {e}")
+
+
     @dp.message(F.successful_payment)
     async def process_successful_payment(message: Message):
         """
@@ -208,10 +270,9 @@ def register_main_handlers(dp, bot, version):
         if message.from_user.id not in ALLOWED_USER_IDS:
             transaction_id = message.successful_payment.telegram_payment_charge_id
             user_id = message.from_user.id
-            bot_user = await message.bot.get_me()
             await message.answer(
                 f"✅ Баланс успешно пополнен.\n\n"
-                f"Для возврата владелец бота @{bot_user.username} должен запустить команду:\n\n"
+                f"Для возврата владелец бота @{bot_username} должен запустить команду:\n\n"
                 f"<code>/refund {user_id} {transaction_id}</code>",
                 message_effect_id="5104841245755180586"
             )
@@ -222,5 +283,5 @@ def register_main_handlers(dp, bot, version):
             f'✅ Баланс успешно пополнен.',
             message_effect_id="5104841245755180586"
         )
-        balance = await refresh_balance(bot)
-        await update_menu(bot=bot, chat_id=message.chat.id, user_id=message.from_user.id, message_id=message.message_id)
+        # Баланс и меню обновляются в фоне — хендлер не ждёт лишних запросов к Telegram
+        asyncio.create_task(post_payment_refresh(message.chat.id, message.from_user.id, message.message_id))
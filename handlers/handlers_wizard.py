@@ -1,25 +1,40 @@
 # --- Стандартные библиотеки ---
+import asyncio
 import logging
+import time
+from functools import lru_cache
 
 # --- Сторонние библиотеки ---
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, LabeledPrice, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.exceptions import TelegramBadRequest, TelegramAPIError
+from aiogram.utils.callback_answer import CallbackAnswerMiddleware, CallbackAnswer
 
 # --- Внутренние модули ---
-from services.config import get_valid_config, get_target_display, save_config
+from services.config import get_valid_config, get_target_display, save_config, notify_config_changed
 from services.menu import update_menu, payment_keyboard
 from services.balance import refresh_balance, refund_all_star_payments
 from services.config import CURRENCY, MAX_PROFILES, ALLOWED_USER_IDS, add_profile, remove_profile, update_profile
 from services.userbot import is_userbot_active, userbot_send_self, delete_userbot_session, start_userbot, continue_userbot_signin, finish_userbot_signin
 from middlewares.access_control import show_guest_menu
-from utils.misc import now_str, is_valid_profile_name, PHONE_REGEX, API_HASH_REGEX
+from middlewares.config_inject import ConfigMiddleware
+from utils.misc import now_str, is_valid_profile_name, parse_positive_int, is_command, PHONE_REGEX, API_HASH_REGEX
 
 logger = logging.getLogger(__name__)
+CHAT_TYPE_TTL = 60.0
+CHAT_TYPE_CACHE_SIZE = 256
+CACHEABLE_CHAT_TYPES = frozenset({"channel", "user", "group", "bot"}) # Только однозначные ответы Telegram
+MAX_DEPOSIT = 10000 # Максимальная сумма одного пополнения в звёздах
+_chat_type_cache: dict[str, tuple[float, str]] = {}  # username -> (timestamp, тип чата)
+
 wizard_router = Router()
+wizard_router.message.middleware(ConfigMiddleware())
+wizard_router.callback_query.middleware(ConfigMiddleware())
+wizard_router.callback_query.middleware(CallbackAnswerMiddleware(pre=True))
 
 
 class ConfigWizard(StatesGroup):
@@ -54,13 +69,88 @@ class ConfigWizard(StatesGroup):
     userbot_password = State()
 
 
+class ProfileCB(CallbackData, prefix="p"):
+    """
+    Callback-данные кнопок профиля: действие и индекс профиля.
+    """
+    action: str
+    idx: int
+
+
+# Кнопки профилей обрабатываются во вложенном роутере: остальные колбэки
+# отсекаются одной проверкой префикса, не перебирая фильтры каждого хендлера
+profile_router = Router()
+profile_router.callback_query.filter(F.data.startswith(f"{ProfileCB.__prefix__}:"))
+wizard_router.include_router(profile_router)
+
+
+# Тексты подсказок и ошибок ввода — собираются один раз при импорте
+_ERR_POSITIVE_INT = "🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена"
+_ERR_TEXT_ONLY = "🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена"
+_PROMPT_EDIT_MIN_PRICE = ("✏️ <b>Редактирование {profile_name}:</b>\n\n"
+                          "💰 Минимальная цена подарка, например: <code>5000</code>\n\n"
+                          "/cancel — отменить")
+_PROMPT_EDIT_MIN_SUPPLY = ("✏️ <b>Редактирование {profile_name}:</b>\n\n"
+                           "📦 Минимальный саплай подарка, например: <code>1000</code>\n\n"
+                           "/cancel — отменить")
+_PROMPT_EDIT_LIMIT = ("✏️ <b>Редактирование {profile_name}:</b>\n\n"
+                      "⭐️ Введите лимит звёзд для этого профиля (например: <code>10000</code>)\n\n"
+                      "/cancel — отменить")
+_PROMPT_EDIT_COUNT = ("✏️ <b>Редактирование {profile_name}:</b>\n\n"
+                      "🎁 Максимальное количество подарков, например: <code>5</code>\n\n"
+                      "/cancel — отменить")
+_PROMPT_EDIT_MAX_PRICE = ("✏️ <b>Редактирование {profile_name}:</b>\n\n"
+                          "💰 Максимальная цена подарка, например: <code>10000</code>\n\n"
+                          "/cancel — отменить")
+_PROMPT_EDIT_MAX_SUPPLY = ("✏️ <b>Редактирование {profile_name}:</b>\n\n"
+                           "📦 Максимальный саплай подарка, например: <code>10000</code>\n\n"
+                           "/cancel — отменить")
+
+# Шаблон карточки профиля на экране редактирования
+_PROFILE_TMPL = ("✏️ <b>Изменение {name}</b>:\n\n"
+                 "┌💰 <b>Цена</b>: {MIN_PRICE:,} – {MAX_PRICE:,} ★\n"
+                 "├📦 <b>Саплай</b>: {MIN_SUPPLY:,} – {MAX_SUPPLY:,}\n"
+                 "├🎁 <b>Куплено</b>: {BOUGHT:,} / {COUNT:,}\n"
+                 "├⭐️ <b>Лимит</b>: {SPENT:,} / {LIMIT:,} ★\n"
+                 "├👤 <b>Получатель</b>: {target}\n"
+                 "└📤 <b>Отправитель</b>: {sender}")
+
+# Подписи отправителя в карточках и списке профилей
+_SENDER_LABELS = {"bot": "<code>Бот</code>"}
+_USERBOT_LABEL = "<code>Юзербот</code>"
+
+# Префикс строки профиля в списке по признакам (первый, последний)
+_PROFILE_PREFIX = {(True, True): "", (True, False): "┌", (False, True): "└", (False, False): "├"}
+
+# Статичные ряды и клавиатуры — собираются один раз при импорте
+_ADD_BTN_ROW = [InlineKeyboardButton(text="➕ Добавить", callback_data="profile_add")]
+_BACK_BTN_ROW = [InlineKeyboardButton(text="☰ Меню", callback_data="profiles_main_menu")]
+SENDER_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="🤖 Бот", callback_data="choose_sender_bot"),
+        InlineKeyboardButton(text="👤 Юзербот", callback_data="choose_sender_userbot")
+    ]
+])
+USERBOT_DELETE_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Да", callback_data="userbot_delete_yes"),
+        InlineKeyboardButton(text="❌ Нет", callback_data="userbot_delete_no")
+    ]
+])
+WITHDRAW_CONFIRM_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Да", callback_data="withdraw_all_confirm"),
+        InlineKeyboardButton(text="❌ Нет", callback_data="withdraw_all_cancel")
+    ]
+])
+
+
 @wizard_router.callback_query(F.data == "userbot_menu")
 async def on_userbot_menu(call: CallbackQuery):
     """
     Вызывает обновление меню userbot'а после колбэка.
     """
     await userbot_menu(call.message, call.from_user.id)
-    await call.answer()
 
 
 async def userbot_menu(message: Message, user_id: int, edit: bool = False):
@@ -129,26 +219,18 @@ async def confirm_userbot_delete(call: CallbackQuery):
     """
     Запрашивает подтверждение удаления userbot-сессии у пользователя.
     """
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ Да", callback_data="userbot_delete_yes"),
-            InlineKeyboardButton(text="❌ Нет", callback_data="userbot_delete_no")
-        ]
-    ])
     await call.message.edit_text(
         "❗ Вы уверены, что хотите <b>удалить юзербот</b>?",
-        reply_markup=kb
+        reply_markup=USERBOT_DELETE_KEYBOARD
     )
-    await call.answer()
 
 
-@wizard_router.callback_query(F.data == "userbot_delete_no")
+@wizard_router.callback_query(F.data == "userbot_delete_no", flags={"callback_answer": {"text": "Отменено."}})
 async def cancel_userbot_delete(call: CallbackQuery):
     """
     Отменяет процесс удаления userbot-сессии и возвращает в меню.
     """
     user_id = call.from_user.id
-    await call.answer("Отменено.")
     await userbot_menu(call.message, user_id, edit=True)
 
 
@@ -167,7 +249,6 @@ async def userbot_delete_handler(call: CallbackQuery):
         await call.message.answer("🚫 Не удалось удалить юзербот. Возможно, он уже был удалена.")
         await userbot_menu(call.message, user_id, edit=False)
 
-    await call.answer()
 
 
 @wizard_router.callback_query(F.data == "userbot_enable")
@@ -182,8 +263,7 @@ async def userbot_enable_handler(call: CallbackQuery):
     config = await get_valid_config(user_id)
     config["USERBOT"]["ENABLED"] = True
     await save_config(config)
-
-    await call.answer()
+    notify_config_changed()
 
     text_message = (
         f"🔔 <b>Юзербот включён.</b>\n\n"
@@ -214,8 +294,6 @@ async def userbot_disable_handler(call: CallbackQuery):
     config["USERBOT"]["ENABLED"] = False
     await save_config(config)
 
-    await call.answer()
-
     text_message = (
         f"🔕 <b>Юзербот выключен.</b>\n\n"
         f"┌🤖 <b>Бот:</b> @{bot_username}\n"
@@ -239,7 +317,6 @@ async def init_userbot_handler(call: CallbackQuery, state: FSMContext):
     """
     await call.message.answer("📥 Введите <b>api_id</b>:\n\n/cancel — отмена")
     await state.set_state(ConfigWizard.userbot_api_id)
-    await call.answer()
 
 
 @wizard_router.message(ConfigWizard.userbot_api_id)
@@ -251,7 +328,7 @@ async def get_api_id(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     text = message.text.strip()
@@ -275,7 +352,7 @@ async def get_api_hash(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     api_hash = message.text.strip()
@@ -298,7 +375,7 @@ async def get_phone(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     raw_phone = message.text.strip()
@@ -328,7 +405,7 @@ async def get_code(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     await state.update_data(code=message.text.strip())
@@ -374,7 +451,7 @@ async def get_password(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     await state.update_data(password=message.text.strip())
@@ -412,7 +489,6 @@ async def userbot_main_menu_callback(call: CallbackQuery, state: FSMContext):
     Очищает все состояния FSM для пользователя.
     """
     await state.clear()
-    await call.answer()
     await safe_edit_text(call.message, "✅ Настройка юзербота завершена.", reply_markup=None)
     await refresh_balance(call.bot)
     await update_menu(
@@ -423,45 +499,38 @@ async def userbot_main_menu_callback(call: CallbackQuery, state: FSMContext):
     )
 
 
-async def profiles_menu(message: Message, user_id: int):
+async def profiles_menu(message: Message, user_id: int, config: dict = None):
     """
     Показывает пользователю главное меню управления профилями.
     Отображает список всех созданных профилей и предоставляет кнопки для их редактирования, удаления или добавления нового профиля.
+    Если config уже загружен хендлером, он переиспользуется без повторного чтения.
     """
-    config = await get_valid_config(user_id)
+    if config is None:
+        config = await get_valid_config(user_id)
     profiles = config.get("PROFILES", [])
+    count = len(profiles)
+    last = count - 1
 
-    # Формируем клавиатуру профилей
+    # Формируем клавиатуру и список профилей за один проход
     keyboard = []
+    lines = []
     for idx, profile in enumerate(profiles):
-        profile_name = f'Профиль {idx + 1}' if  not profile['NAME'] else profile['NAME']
-        btns = [
+        profile_name = profile['NAME'] or f'Профиль {idx + 1}'
+        keyboard.append([
             InlineKeyboardButton(
-                text=f"✏️ {profile_name}", callback_data=f"profile_edit_{idx}"
+                text=f"✏️ {profile_name}", callback_data=ProfileCB(action="edit", idx=idx).pack()
             ),
             InlineKeyboardButton(
-                text="🗑 Удалить", callback_data=f"profile_delete_{idx}"
+                text="🗑 Удалить", callback_data=ProfileCB(action="delete", idx=idx).pack()
             ),
-        ]
-        keyboard.append(btns)
+        ])
+        prefix = _PROFILE_PREFIX[(idx == 0, idx == last)]
+        lines.append(f"{prefix}🏷️ <b>{profile_name} {_sender_label(profile)}</b> → {get_target_display(profile, user_id)}")
     # Кнопка добавления (максимум 3 профиля)
-    if len(profiles) < MAX_PROFILES:
-        keyboard.append([InlineKeyboardButton(text="➕ Добавить", callback_data="profile_add")])
+    if count < MAX_PROFILES:
+        keyboard.append(_ADD_BTN_ROW)
     # Кнопка назад
-    keyboard.append([InlineKeyboardButton(text="☰ Меню", callback_data="profiles_main_menu")])
-
-    profiles = config.get("PROFILES", [])
-
-    lines = []
-    for idx, profile in enumerate(profiles, 1):
-        target_display = get_target_display(profile, user_id)
-        profile_name = f'Профиль {idx}' if  not profile['NAME'] else profile['NAME']
-        sender = '<code>Бот</code>' if profile['SENDER'] == 'bot' else '<code>Юзербот</code>'
-        if idx == 1 and len(profiles) == 1: line = (f"🏷️ <b>{profile_name} {sender}</b> → {target_display}")
-        elif idx == 1: line = (f"┌🏷️ <b>{profile_name} {sender}</b> → {target_display}")
-        elif len(profiles) == idx: line = (f"└🏷️ <b>{profile_name} {sender}</b> → {target_display}")
-        else: line = (f"├🏷️ <b>{profile_name} {sender}</b> → {target_display}")
-        lines.append(line)
+    keyboard.append(_BACK_BTN_ROW)
     text_profiles = "\n".join(lines)
 
     kb = InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -472,13 +541,19 @@ async def profiles_menu(message: Message, user_id: int):
 
 
 @wizard_router.callback_query(F.data == "profiles_menu")
-async def on_profiles_menu(call: CallbackQuery):
+async def on_profiles_menu(call: CallbackQuery, config: dict):
     """
     Обрабатывает нажатие на кнопку "Профили" или переход к списку профилей.
     Открывает меню со всеми профилями пользователя и возможностью их выбора для редактирования или удаления.
     """
-    await profiles_menu(call.message, call.from_user.id)
-    await call.answer()
+    await profiles_menu(call.message, call.from_user.id, config)
+
+
+def _sender_label(profile: dict) -> str:
+    """
+    Подпись отправителя профиля: всё, кроме бота, показывается как юзербот.
+    """
+    return _SENDER_LABELS.get(profile['SENDER'], _USERBOT_LABEL)
 
 
 def profile_text(profile, idx, user_id):
@@ -487,68 +562,125 @@ def profile_text(profile, idx, user_id):
     Включает цены, лимиты, supply, получателя и другую основную информацию по выбранному профилю.
     Используется для вывода информации при редактировании профиля.
     """
-    target_display = get_target_display(profile, user_id)
-    profile_name = f'Профиль {idx + 1}' if  not profile['NAME'] else profile['NAME']
-    sender = '<code>Бот</code>' if profile['SENDER'] == 'bot' else '<code>Юзербот</code>'
-    return (f"✏️ <b>Изменение {profile_name}</b>:\n\n"
-            f"┌💰 <b>Цена</b>: {profile.get('MIN_PRICE'):,} – {profile.get('MAX_PRICE'):,} ★\n"
-            f"├📦 <b>Саплай</b>: {profile.get('MIN_SUPPLY'):,} – {profile.get('MAX_SUPPLY'):,}\n"
-            f"├🎁 <b>Куплено</b>: {profile.get('BOUGHT'):,} / {profile.get('COUNT'):,}\n"
-            f"├⭐️ <b>Лимит</b>: {profile.get('SPENT'):,} / {profile.get('LIMIT'):,} ★\n"
-            f"├👤 <b>Получатель</b>: {target_display}\n"
-            f"└📤 <b>Отправитель</b>: {sender}")
+    return _PROFILE_TMPL.format(
+        name=profile['NAME'] or f'Профиль {idx + 1}',
+        target=get_target_display(profile, user_id),
+        sender=_sender_label(profile),
+        **profile
+    )
 
 
+@lru_cache(maxsize=MAX_PROFILES)
 def profile_edit_keyboard(idx):
     """
     Создаёт инлайн-клавиатуру для быстрого редактирования параметров выбранного профиля.
     Каждая кнопка отвечает за редактирование отдельного поля (цены, supply, лимита и т.д.).
+    Клавиатура кэшируется по индексу профиля.
     """
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [
-                InlineKeyboardButton(text="💰 Цена", callback_data=f"edit_profile_price_{idx}"),
-                InlineKeyboardButton(text="📦 Саплай", callback_data=f"edit_profile_supply_{idx}"),
+                InlineKeyboardButton(text="💰 Цена", callback_data=ProfileCB(action="price", idx=idx).pack()),
+                InlineKeyboardButton(text="📦 Саплай", callback_data=ProfileCB(action="supply", idx=idx).pack()),
             ],
             [
-                InlineKeyboardButton(text="🎁 Количество", callback_data=f"edit_profile_count_{idx}"),
-                InlineKeyboardButton(text="⭐️ Лимит", callback_data=f"edit_profile_limit_{idx}")
+                InlineKeyboardButton(text="🎁 Количество", callback_data=ProfileCB(action="count", idx=idx).pack()),
+                InlineKeyboardButton(text="⭐️ Лимит", callback_data=ProfileCB(action="limit", idx=idx).pack())
             ],
             [
-                InlineKeyboardButton(text="👤 Получатель", callback_data=f"edit_profile_target_{idx}"),
-                InlineKeyboardButton(text="📤 Отправитель", callback_data=f"edit_profile_sender_{idx}")
+                InlineKeyboardButton(text="👤 Получатель", callback_data=ProfileCB(action="target", idx=idx).pack()),
+                InlineKeyboardButton(text="📤 Отправитель", callback_data=ProfileCB(action="sender", idx=idx).pack())
             ],
             [
-                InlineKeyboardButton(text="🏷️ Название", callback_data=f"edit_profile_name_{idx}"),
-                InlineKeyboardButton(text="⬅️ Назад", callback_data=f"edit_profiles_menu_{idx}")
+                InlineKeyboardButton(text="🏷️ Название", callback_data=ProfileCB(action="name", idx=idx).pack()),
+                InlineKeyboardButton(text="⬅️ Назад", callback_data=ProfileCB(action="back", idx=idx).pack())
             ],
+            _BACK_BTN_ROW
+        ]
+    )
+
+
+@lru_cache(maxsize=MAX_PROFILES)
+def delete_confirm_keyboard(idx):
+    """
+    Клавиатура подтверждения удаления профиля. Кэшируется по индексу профиля.
+    """
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
             [
-                InlineKeyboardButton(text="☰ Меню", callback_data="profiles_main_menu")
+                InlineKeyboardButton(text="✅ Да", callback_data=ProfileCB(action="confirm_delete", idx=idx).pack()),
+                InlineKeyboardButton(text="❌ Нет", callback_data=ProfileCB(action="cancel_delete", idx=idx).pack()),
             ]
         ]
     )
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("profile_edit_"))
-async def on_profile_edit(call: CallbackQuery, state: FSMContext):
+async def _safe_delete(bot: Bot, chat_id: int, message_id: int):
+    """
+    Удаляет сообщение, не прерывая сценарий при ошибке.
+    """
+    try:
+        await bot.delete_message(chat_id, message_id)
+    except Exception as e:
+        logger.warning(f"Не удалось удалить сообщение: {e}")
+
+
+async def _parse_target(bot: Bot, text: str) -> tuple[dict | None, str | None]:
+    """
+    Разбирает ввод получателя: @username (канал или пользователь) или числовой ID.
+    Возвращает (поля профиля TARGET_*, None) или (None, текст ошибки).
+    """
+    user_input = text.strip()
+    if user_input.startswith("@"):
+        chat_type = await _cached_chat_type(bot, user_input)
+        if chat_type == "channel":
+            return {"TARGET_USER_ID": None, "TARGET_CHAT_ID": user_input, "TARGET_TYPE": "channel"}, None
+        if chat_type == "unknown":
+            return {"TARGET_USER_ID": None, "TARGET_CHAT_ID": user_input, "TARGET_TYPE": "username"}, None
+        return None, "🚫 Вы указали неправильный <b>username канала</b>. Попробуйте ещё раз.\n\n/cancel — отмена"
+    if user_input.isdigit():
+        return {"TARGET_USER_ID": int(user_input), "TARGET_CHAT_ID": None, "TARGET_TYPE": "user_id"}, None
+    return None, "🚫 Введите ID или @username канала. Попробуйте ещё раз.\n\n/cancel — отмена"
+
+
+async def _finalize_profile_edit(message: Message, state: FSMContext, config: dict, idx: int, data: dict, delta: dict):
+    """
+    Общее завершение шага редактирования профиля: применяет изменения одной записью,
+    обновляет карточку профиля на месте (или присылает новую, если правка не удалась)
+    и очищает состояние FSM.
+    """
+    profile = config["PROFILES"][idx]
+    profile.update(delta)
+    await save_config(config)
+    notify_config_changed()
+
+    text = profile_text(profile, idx, message.from_user.id)
+    keyboard = profile_edit_keyboard(idx)
+    if not await safe_edit_text_by_id(message.bot, message.chat.id, data["message_id"], text, reply_markup=keyboard):
+        await asyncio.gather(
+            _safe_delete(message.bot, message.chat.id, data["message_id"]),
+            message.answer(text, reply_markup=keyboard)
+        )
+    await state.clear()
+
+
+@profile_router.callback_query(ProfileCB.filter(F.action == "edit"))
+async def on_profile_edit(call: CallbackQuery, callback_data: ProfileCB, state: FSMContext, config: dict):
     """
     Открывает экран подробного редактирования конкретного профиля.
     Показывает все параметры профиля и инлайн-кнопки для выбора нужного параметра для изменения.
     """
-    idx = int(call.data.split("_")[-1])
-    config = await get_valid_config(call.from_user.id)
+    idx = callback_data.idx
     profile = config["PROFILES"][idx]
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     await call.message.edit_text(
         profile_text(profile, idx, call.from_user.id),
         reply_markup=profile_edit_keyboard(idx)
     )
-    await call.answer()
 
 
 @wizard_router.message(ConfigWizard.edit_profile_name)
-async def on_profile_name_entered(message: Message, state: FSMContext):
+async def on_profile_name_entered(message: Message, state: FSMContext, config: dict):
     """
     Обработка ввода нового имени профиля.
     """
@@ -556,7 +688,7 @@ async def on_profile_name_entered(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     name = message.text.strip()
@@ -573,7 +705,6 @@ async def on_profile_name_entered(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    config = await get_valid_config(message.from_user.id)
     profiles = config.get("PROFILES", [])
     if idx < 0 or idx >= len(profiles):
         await message.answer("Ошибка: профиль не найден.")
@@ -585,100 +716,78 @@ async def on_profile_name_entered(message: Message, state: FSMContext):
     await message.answer(f"✅ Имя профиля успешно изменено на: <b>{name}</b>")
 
     # Вернуться к меню профилей (вызывайте свою функцию профилей)
-    await profiles_menu(message, message.from_user.id)
+    await profiles_menu(message, message.from_user.id, config)
     await state.clear()
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("edit_profile_price_"))
-async def edit_profile_min_price(call: CallbackQuery, state: FSMContext):
+@profile_router.callback_query(ProfileCB.filter(F.action == "price"))
+async def edit_profile_min_price(call: CallbackQuery, callback_data: ProfileCB, state: FSMContext, config: dict):
     """
     Обрабатывает нажатие на кнопку изменения минимальной цены в профиле.
     Переводит пользователя в состояние ввода новой минимальной цены.
     """
-    idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
-    config = await get_valid_config(call.from_user.id)
+    idx = callback_data.idx
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     profiles = config.get("PROFILES", [])
     profile = profiles[idx]
     profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
-    await call.message.answer(f"✏️ <b>Редактирование {profile_name}:</b>\n\n"
-                              "💰 Минимальная цена подарка, например: <code>5000</code>\n\n"
-                              "/cancel — отменить")
+    await call.message.answer(_PROMPT_EDIT_MIN_PRICE.format(profile_name=profile_name))
     await state.set_state(ConfigWizard.edit_min_price)
-    await call.answer()
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("edit_profile_supply_"))
-async def edit_profile_min_supply(call: CallbackQuery, state: FSMContext):
+@profile_router.callback_query(ProfileCB.filter(F.action == "supply"))
+async def edit_profile_min_supply(call: CallbackQuery, callback_data: ProfileCB, state: FSMContext, config: dict):
     """
     Обрабатывает нажатие на кнопку изменения минимального supply для профиля.
     Переводит пользователя в состояние ввода нового минимального значения supply.
     """
-    idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
-    config = await get_valid_config(call.from_user.id)
+    idx = callback_data.idx
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     profiles = config.get("PROFILES", [])
     profile = profiles[idx]
     profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
-    await call.message.answer(f"✏️ <b>Редактирование {profile_name}:</b>\n\n"
-                              "📦 Минимальный саплай подарка, например: <code>1000</code>\n\n"
-                              "/cancel — отменить")
+    await call.message.answer(_PROMPT_EDIT_MIN_SUPPLY.format(profile_name=profile_name))
     await state.set_state(ConfigWizard.edit_min_supply)
-    await call.answer()
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("edit_profile_limit_"))
-async def edit_profile_limit(call: CallbackQuery, state: FSMContext):
+@profile_router.callback_query(ProfileCB.filter(F.action == "limit"))
+async def edit_profile_limit(call: CallbackQuery, callback_data: ProfileCB, state: FSMContext, config: dict):
     """
     Обрабатывает нажатие на кнопку изменения лимита по звёздам (максимальной суммы расходов) для профиля.
     Переводит пользователя в состояние ввода нового лимита.
     """
-    idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
-    config = await get_valid_config(call.from_user.id)
+    idx = callback_data.idx
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     profiles = config.get("PROFILES", [])
     profile = profiles[idx]
     profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
-    await call.message.answer(f"✏️ <b>Редактирование {profile_name}:</b>\n\n"
-                              "⭐️ Введите лимит звёзд для этого профиля (например: <code>10000</code>)\n\n"
-                              "/cancel — отменить")
+    await call.message.answer(_PROMPT_EDIT_LIMIT.format(profile_name=profile_name))
     await state.set_state(ConfigWizard.edit_limit)
-    await call.answer()
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("edit_profile_count_"))
-async def edit_profile_count(call: CallbackQuery, state: FSMContext):
+@profile_router.callback_query(ProfileCB.filter(F.action == "count"))
+async def edit_profile_count(call: CallbackQuery, callback_data: ProfileCB, state: FSMContext, config: dict):
     """
     Обрабатывает нажатие на кнопку изменения количества подарков в профиле.
     Переводит пользователя в состояние ввода нового количества.
     """
-    idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
-    config = await get_valid_config(call.from_user.id)
+    idx = callback_data.idx
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     profiles = config.get("PROFILES", [])
     profile = profiles[idx]
     profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
-    await call.message.answer(f"✏️ <b>Редактирование {profile_name}:</b>\n\n"
-                              "🎁 Максимальное количество подарков, например: <code>5</code>\n\n"
-                              "/cancel — отменить")
+    await call.message.answer(_PROMPT_EDIT_COUNT.format(profile_name=profile_name))
     await state.set_state(ConfigWizard.edit_count)
-    await call.answer()
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("edit_profile_target_"))
-async def edit_profile_target(call: CallbackQuery, state: FSMContext):
+@profile_router.callback_query(ProfileCB.filter(F.action == "target"))
+async def edit_profile_target(call: CallbackQuery, callback_data: ProfileCB, state: FSMContext, config: dict):
     """
     Обрабатывает нажатие на кнопку изменения получателя подарков (user_id или @username).
     Переводит пользователя в состояние ввода нового получателя.
     """
-    idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
-    config = await get_valid_config(call.from_user.id)
+    idx = callback_data.idx
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     profiles = config.get("PROFILES", [])
     profile = profiles[idx]
     profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
@@ -695,30 +804,28 @@ async def edit_profile_target(call: CallbackQuery, state: FSMContext):
                     "/cancel — отменить")
     await call.message.answer(message_text)
     await state.set_state(ConfigWizard.edit_user_id)
-    await call.answer()
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("edit_profile_name_"))
-async def edit_profile_name(call: CallbackQuery, state: FSMContext):
+@profile_router.callback_query(ProfileCB.filter(F.action == "name"))
+async def edit_profile_name(call: CallbackQuery, callback_data: ProfileCB, state: FSMContext):
     """
     Кнопка "Переименовать профиль". Сохраняет индекс и ждет новое имя.
     """
-    idx = int(call.data.split("_")[-1])
+    idx = callback_data.idx
     await state.update_data(profile_index=idx)
     await call.message.answer(f"✏️ Введите новое имя для профиля {idx + 1}: (до 12 символов)\n\n"
                               "/cancel — отменить")
     await state.set_state(ConfigWizard.edit_profile_name)
-    await call.answer()
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("edit_profile_sender_"))
-async def edit_profile_sender(call: CallbackQuery, state: FSMContext):
-    idx = int(call.data.removeprefix("edit_profile_sender_"))
-    config = await get_valid_config(call.from_user.id)
+@profile_router.callback_query(ProfileCB.filter(F.action == "sender"), flags={"callback_answer": {"pre": False}})
+async def edit_profile_sender(call: CallbackQuery, callback_data: ProfileCB, callback_answer: CallbackAnswer, state: FSMContext, config: dict):
+    idx = callback_data.idx
     profiles = config.get("PROFILES", [])
 
     if idx >= len(profiles):
-        await call.answer("Профиль не найден.", show_alert=True)
+        callback_answer.text = "Профиль не найден."
+        callback_answer.show_alert = True
         return
 
     profile = profiles[idx]
@@ -734,14 +841,8 @@ async def edit_profile_sender(call: CallbackQuery, state: FSMContext):
                                  "👤 <code>Юзербот</code> - покупки с баланса юзербота\n\n"
                                  "❗️ Если отправитель <code>Юзербот</code>, убедитесь, что он <b>включён</b> 🔔\n\n"
                                  "/cancel — отменить",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="🤖 Бот", callback_data="choose_sender_bot"),
-                InlineKeyboardButton(text="👤 Юзербот", callback_data="choose_sender_userbot")
-            ]
-        ])
+        reply_markup=SENDER_KEYBOARD
     )
-    await call.answer()
 
 
 @wizard_router.message(ConfigWizard.gift_sender)
@@ -768,24 +869,22 @@ async def handle_gift_sender_input(message: Message, state: FSMContext):
                          "/cancel — отменить")
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("edit_profiles_menu_"))
-async def edit_profiles_menu(call: CallbackQuery):
+@profile_router.callback_query(ProfileCB.filter(F.action == "back"))
+async def edit_profiles_menu(call: CallbackQuery, callback_data: ProfileCB, config: dict):
     """
     Обрабатывает возврат из режима редактирования профиля в основное меню профилей.
     Открывает пользователю общий список всех профилей.
     """
-    idx = int(call.data.split("_")[-1])
-    config = await get_valid_config(call.from_user.id)
+    idx = callback_data.idx
     profiles = config.get("PROFILES", [])
     profile = profiles[idx]
     profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
     await safe_edit_text(call.message, f"✅ Редактирование <b>{profile_name}</b> завершено.", reply_markup=None)
-    await profiles_menu(call.message, call.from_user.id)
-    await call.answer()
+    await profiles_menu(call.message, call.from_user.id, config)
 
 
 @wizard_router.message(ConfigWizard.edit_min_price)
-async def step_edit_min_price(message: Message, state: FSMContext):
+async def step_edit_min_price(message: Message, state: FSMContext, config: dict):
     """
     Обрабатывает ввод пользователем нового значения минимальной цены для профиля.
     Проверяет валидность, сохраняет и возвращает пользователя в меню профиля.
@@ -794,31 +893,26 @@ async def step_edit_min_price(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     data = await state.get_data()
     idx = data["profile_index"]
     
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-        await state.update_data(MIN_PRICE=value)
-        config = await get_valid_config(message.from_user.id)
-        profiles = config.get("PROFILES", [])
-        profile = profiles[idx]
-        profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
-        await message.answer(f"✏️ <b>Редактирование {profile_name}:</b>\n\n"
-                             "💰 Максимальная цена подарка, например: <code>10000</code>\n\n"
-                             "/cancel — отменить")
-        await state.set_state(ConfigWizard.edit_max_price)
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
+    await state.update_data(MIN_PRICE=value)
+    profiles = config.get("PROFILES", [])
+    profile = profiles[idx]
+    profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
+    await message.answer(_PROMPT_EDIT_MAX_PRICE.format(profile_name=profile_name))
+    await state.set_state(ConfigWizard.edit_max_price)
 
 
 @wizard_router.message(ConfigWizard.edit_max_price)
-async def step_edit_max_price(message: Message, state: FSMContext):
+async def step_edit_max_price(message: Message, state: FSMContext, config: dict):
     """
     Обрабатывает ввод пользователем нового значения максимальной цены для профиля.
     Проверяет валидность, сохраняет и возвращает пользователя в меню профиля.
@@ -827,44 +921,27 @@ async def step_edit_max_price(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     data = await state.get_data()
     idx = data["profile_index"]
     
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-
-        data = await state.get_data()
-        min_price = data.get("MIN_PRICE")
-        if min_price and value < min_price:
-            await message.answer("🚫 Максимальная цена не может быть меньше минимальной. Попробуйте ещё раз.\n\n/cancel — отмена")
-            return
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
 
-        config = await get_valid_config(message.from_user.id)
-        config["PROFILES"][idx]["MIN_PRICE"] = data["MIN_PRICE"]
-        config["PROFILES"][idx]["MAX_PRICE"] = value
-        await save_config(config)
+    min_price = data.get("MIN_PRICE")
+    if min_price and value < min_price:
+        await message.answer("🚫 Максимальная цена не может быть меньше минимальной. Попробуйте ещё раз.\n\n/cancel — отмена")
+        return
 
-        try:
-            await message.bot.delete_message(message.chat.id, data["message_id"])
-        except Exception as e:
-            logger.warning(f"Не удалось удалить сообщение: {e}")
-
-        await message.answer(
-            profile_text(config["PROFILES"][idx], idx, message.from_user.id),
-            reply_markup=profile_edit_keyboard(idx)
-        )
-        await state.clear()
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    await _finalize_profile_edit(message, state, config, idx, data, {"MIN_PRICE": data["MIN_PRICE"], "MAX_PRICE": value})
 
 
 @wizard_router.message(ConfigWizard.edit_min_supply)
-async def step_edit_min_supply(message: Message, state: FSMContext):
+async def step_edit_min_supply(message: Message, state: FSMContext, config: dict):
     """
     Обрабатывает ввод пользователем нового значения минимального supply для профиля.
     Проверяет валидность, сохраняет и возвращает пользователя в меню профиля.
@@ -873,31 +950,26 @@ async def step_edit_min_supply(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     data = await state.get_data()
     idx = data["profile_index"]
     
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-        await state.update_data(MIN_SUPPLY=value)
-        config = await get_valid_config(message.from_user.id)
-        profiles = config.get("PROFILES", [])
-        profile = profiles[idx]
-        profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
-        await message.answer(f"✏️ <b>Редактирование {profile_name}:</b>\n\n"
-                             "📦 Максимальный саплай подарка, например: <code>10000</code>\n\n"
-                             "/cancel — отменить")
-        await state.set_state(ConfigWizard.edit_max_supply)
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
+    await state.update_data(MIN_SUPPLY=value)
+    profiles = config.get("PROFILES", [])
+    profile = profiles[idx]
+    profile_name = f'профиля {idx+1}' if  not profile['NAME'] else profile['NAME']
+    await message.answer(_PROMPT_EDIT_MAX_SUPPLY.format(profile_name=profile_name))
+    await state.set_state(ConfigWizard.edit_max_supply)
 
 
 @wizard_router.message(ConfigWizard.edit_max_supply)
-async def step_edit_max_supply(message: Message, state: FSMContext):
+async def step_edit_max_supply(message: Message, state: FSMContext, config: dict):
     """
     Обрабатывает ввод пользователем нового значения максимального supply для профиля.
     Проверяет валидность, сохраняет и возвращает пользователя в меню профиля.
@@ -906,44 +978,27 @@ async def step_edit_max_supply(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     data = await state.get_data()
     idx = data["profile_index"]
     
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-
-        data = await state.get_data()
-        min_supply = data.get("MIN_SUPPLY")
-        if min_supply and value < min_supply:
-            await message.answer("🚫 Максимальный саплай не может быть меньше минимального. Попробуйте ещё раз.\n\n/cancel — отмена")
-            return
-        
-        config = await get_valid_config(message.from_user.id)
-        config["PROFILES"][idx]["MIN_SUPPLY"] = data["MIN_SUPPLY"]
-        config["PROFILES"][idx]["MAX_SUPPLY"] = value
-        await save_config(config)
-
-        try:
-            await message.bot.delete_message(message.chat.id, data["message_id"])
-        except Exception as e:
-            logger.warning(f"Не удалось удалить сообщение: {e}")
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
 
-        await message.answer(
-            profile_text(config["PROFILES"][idx], idx, message.from_user.id),
-            reply_markup=profile_edit_keyboard(idx)
-        )
-        await state.clear()
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    min_supply = data.get("MIN_SUPPLY")
+    if min_supply and value < min_supply:
+        await message.answer("🚫 Максимальный саплай не может быть меньше минимального. Попробуйте ещё раз.\n\n/cancel — отмена")
+        return
+        
+    await _finalize_profile_edit(message, state, config, idx, data, {"MIN_SUPPLY": data["MIN_SUPPLY"], "MAX_SUPPLY": value})
 
 
 @wizard_router.message(ConfigWizard.edit_limit)
-async def step_edit_limit(message: Message, state: FSMContext):
+async def step_edit_limit(message: Message, state: FSMContext, config: dict):
     """
     Обрабатывает ввод пользователем нового значения лимита (максимальной суммы расходов) для профиля.
     Проверяет валидность, сохраняет и возвращает пользователя в меню профиля.
@@ -952,37 +1007,22 @@ async def step_edit_limit(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
 
     data = await state.get_data()
     idx = data["profile_index"]
 
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
         
-        config = await get_valid_config(message.from_user.id)
-        config["PROFILES"][idx]["LIMIT"] = value
-        await save_config(config)
-
-        try:
-            await message.bot.delete_message(message.chat.id, data["message_id"])
-        except Exception as e:
-            logger.warning(f"Не удалось удалить сообщение: {e}")
-
-        await message.answer(
-            profile_text(config["PROFILES"][idx], idx, message.from_user.id),
-            reply_markup=profile_edit_keyboard(idx)
-        )
-        await state.clear()
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    await _finalize_profile_edit(message, state, config, idx, data, {"LIMIT": value})
 
 
 @wizard_router.message(ConfigWizard.edit_count)
-async def step_edit_count(message: Message, state: FSMContext):
+async def step_edit_count(message: Message, state: FSMContext, config: dict):
     """
     Обрабатывает ввод пользователем нового количества подарков для профиля.
     Проверяет валидность, сохраняет и возвращает пользователя в меню профиля.
@@ -991,37 +1031,22 @@ async def step_edit_count(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     data = await state.get_data()
     idx = data["profile_index"]
 
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
         
-        config = await get_valid_config(message.from_user.id)
-        config["PROFILES"][idx]["COUNT"] = value
-        await save_config(config)
-
-        try:
-            await message.bot.delete_message(message.chat.id, data["message_id"])
-        except Exception as e:
-            logger.warning(f"Не удалось удалить сообщение: {e}")
-
-        await message.answer(
-            profile_text(config["PROFILES"][idx], idx, message.from_user.id),
-            reply_markup=profile_edit_keyboard(idx)
-        )
-        await state.clear()
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    await _finalize_profile_edit(message, state, config, idx, data, {"COUNT": value})
 
 
 @wizard_router.message(ConfigWizard.edit_user_id)
-async def step_edit_user_id(message: Message, state: FSMContext):
+async def step_edit_user_id(message: Message, state: FSMContext, config: dict):
     """
     Обрабатывает ввод пользователем нового получателя (user_id или @username) для профиля.
     Проверяет корректность, сохраняет и возвращает пользователя в меню профиля.
@@ -1030,67 +1055,35 @@ async def step_edit_user_id(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
     data = await state.get_data()
     idx = data["profile_index"]
 
-    user_input = message.text.strip()
-    if user_input.startswith("@"):
-        chat_type = await get_chat_type(bot=message.bot, username=user_input)
-        if chat_type == "channel":
-            target_chat = user_input
-            target_user = None
-            target_type = "channel"
-        elif chat_type == "unknown":
-            target_chat = user_input
-            target_user = None
-            target_type = "username"
-        else:
-            await message.answer("🚫 Вы указали неправильный <b>username канала</b>. Попробуйте ещё раз.\n\n/cancel — отмена")
-            return
-    elif user_input.isdigit():
-        target_chat = None
-        target_user = int(user_input)
-        target_type = "user_id"
-    else:
-        await message.answer("🚫 Введите ID или @username канала. Попробуйте ещё раз.\n\n/cancel — отмена")
+    target, error = await _parse_target(message.bot, message.text)
+    if error:
+        await message.answer(error)
         return
     
-    config = await get_valid_config(message.from_user.id)
-    config["PROFILES"][idx]["TARGET_USER_ID"] = target_user
-    config["PROFILES"][idx]["TARGET_CHAT_ID"] = target_chat
-    config["PROFILES"][idx]["TARGET_TYPE"] = target_type
-    await save_config(config)
-
-    try:
-        await message.bot.delete_message(message.chat.id, data["message_id"])
-    except Exception as e:
-        logger.warning(f"Не удалось удалить сообщение: {e}")
-
-    await message.answer(
-            profile_text(config["PROFILES"][idx], idx, message.from_user.id),
-            reply_markup=profile_edit_keyboard(idx)
-        )
-    await state.clear()
+    await _finalize_profile_edit(message, state, config, idx, data, target)
 
 
 @wizard_router.callback_query(F.data == "choose_sender_bot")
-async def choose_sender_bot(call: CallbackQuery, state: FSMContext):
+async def choose_sender_bot(call: CallbackQuery, state: FSMContext, config: dict):
     """
     Обрабатывает выбор отправителя «Бот» при оформлении подарка.
     """
-    await save_sender_and_finish(call, state, sender="bot")
+    await save_sender_and_finish(call, state, config, sender="bot")
 
 @wizard_router.callback_query(F.data == "choose_sender_userbot")
-async def choose_sender_userbot(call: CallbackQuery, state: FSMContext):
+async def choose_sender_userbot(call: CallbackQuery, state: FSMContext, config: dict):
     """
     Обрабатывает выбор отправителя «Юзербот» при оформлении подарка.
     """
-    await save_sender_and_finish(call, state, sender="userbot")
+    await save_sender_and_finish(call, state, config, sender="userbot")
 
-async def save_sender_and_finish(call: CallbackQuery, state: FSMContext, sender: str):
+async def save_sender_and_finish(call: CallbackQuery, state: FSMContext, config: dict, sender: str):
     """
     Сохраняет выбранного отправителя (бот или юзербот) в состояние FSM 
     и завершает процесс, возвращая пользователя в главное меню.
@@ -1106,24 +1099,21 @@ async def save_sender_and_finish(call: CallbackQuery, state: FSMContext, sender:
     
     profile_data["SENDER"] = sender
 
-    config = await get_valid_config(call.from_user.id)
-
     if idx is None:
         await add_profile(config, profile_data)
         msg = "✅ <b>Новый профиль</b> создан."
         await call.message.edit_text(msg)
-        await profiles_menu(call.message, call.from_user.id)
+        await profiles_menu(call.message, call.from_user.id, config)
     else:
         await update_profile(config, idx, profile_data)
         msg = f"✅ <b>Профиль {idx + 1}</b> обновлён."
         await call.message.edit_text(msg)
         await call.message.answer(
-            profile_text(config["PROFILES"][idx], idx, call.from_user.id),
+            profile_text(profile_data, idx, call.from_user.id),
             reply_markup=profile_edit_keyboard(idx)
         )
 
     await state.clear()
-    await call.answer()
 
 @wizard_router.callback_query(F.data == "profile_add")
 async def on_profile_add(call: CallbackQuery, state: FSMContext):
@@ -1136,7 +1126,6 @@ async def on_profile_add(call: CallbackQuery, state: FSMContext):
                               "💰 Минимальная цена подарка, например: <code>5000</code>\n\n"
                               "/cancel — отменить", reply_markup=None)
     await state.set_state(ConfigWizard.min_price)
-    await call.answer()
 
 
 @wizard_router.message(ConfigWizard.user_id)
@@ -1148,29 +1137,12 @@ async def step_user_id(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
 
-    user_input = message.text.strip()
-    if user_input.startswith("@"):
-        chat_type = await get_chat_type(bot=message.bot, username=user_input)
-        if chat_type == "channel":
-            target_chat = user_input
-            target_user = None
-            target_type = "channel"
-        elif chat_type == "unknown":
-            target_chat = user_input
-            target_user = None
-            target_type = "username"
-        else:
-            await message.answer("🚫 Вы указали неправильный <b>username канала</b>. Попробуйте ещё раз.\n\n/cancel — отмена")
-            return
-    elif user_input.isdigit():
-        target_chat = None
-        target_user = int(user_input)
-        target_type = "user_id"
-    else:
-        await message.answer("🚫 Введите ID или @username канала. Попробуйте ещё раз.\n\n/cancel — отмена")
+    target, error = await _parse_target(message.bot, message.text)
+    if error:
+        await message.answer(error)
         return
 
     data = await state.get_data()
@@ -1181,9 +1153,7 @@ async def step_user_id(message: Message, state: FSMContext):
         "MAX_SUPPLY": data["MAX_SUPPLY"],
         "LIMIT": data["LIMIT"],
         "COUNT": data["COUNT"],
-        "TARGET_USER_ID": target_user,
-        "TARGET_CHAT_ID": target_chat,
-        "TARGET_TYPE": target_type,
+        **target,
         "BOUGHT": 0,
         "SPENT": 0,
         "DONE": False,
@@ -1196,12 +1166,7 @@ async def step_user_id(message: Message, state: FSMContext):
                          "🤖 <code>Бот</code> - покупки с баланса бота\n"
                          "👤 <code>Юзербот</code> - покупки с баланса юзербота\n\n"
                          "/cancel — отменить",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="🤖 Бот", callback_data="choose_sender_bot"),
-                InlineKeyboardButton(text="👤 Юзербот", callback_data="choose_sender_userbot")
-            ]
-        ])
+        reply_markup=SENDER_KEYBOARD
     )
     await state.set_state(ConfigWizard.gift_sender)
 
@@ -1213,7 +1178,6 @@ async def profiles_main_menu_callback(call: CallbackQuery, state: FSMContext):
     Очищает все состояния FSM для пользователя.
     """
     await state.clear()
-    await call.answer()
     await safe_edit_text(call.message, "✅ Редактирование профилей завершено.", reply_markup=None)
     await refresh_balance(call.bot)
     await update_menu(
@@ -1224,26 +1188,17 @@ async def profiles_main_menu_callback(call: CallbackQuery, state: FSMContext):
     )
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("profile_delete_"))
-async def on_profile_delete_confirm(call: CallbackQuery, state: FSMContext):
+@profile_router.callback_query(ProfileCB.filter(F.action == "delete"))
+async def on_profile_delete_confirm(call: CallbackQuery, callback_data: ProfileCB, state: FSMContext, config: dict):
     """
     Запрашивает подтверждение удаления профиля.
     """
-    idx = int(call.data.split("_")[-1])
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Да", callback_data=f"confirm_delete_{idx}"),
-                InlineKeyboardButton(text="❌ Нет", callback_data=f"cancel_delete_{idx}"),
-            ]
-        ]
-    )
-    config = await get_valid_config(call.from_user.id)
+    idx = callback_data.idx
     profiles = config.get("PROFILES", [])
     profile = profiles[idx]
     target_display = get_target_display(profile, call.from_user.id)
     profile_name = f'Профиль {idx + 1}' if  not profile['NAME'] else profile['NAME']
-    sender = '<code>Бот</code>' if profile['SENDER'] == 'bot' else '<code>Юзербот</code>'
+    sender = _sender_label(profile)
     message = (f"┌🏷️ <b>{profile_name}</b> (куплено {profile.get('BOUGHT'):,} из {profile.get('COUNT'):,})\n"
             f"├💰 <b>Цена</b>: {profile.get('MIN_PRICE'):,} – {profile.get('MAX_PRICE'):,} ★\n"
             f"├📦 <b>Саплай</b>: {profile.get('MIN_SUPPLY'):,} – {profile.get('MAX_SUPPLY'):,}\n"
@@ -1252,38 +1207,31 @@ async def on_profile_delete_confirm(call: CallbackQuery, state: FSMContext):
             f"└📤 <b>Отправитель</b>: {sender}")
     await call.message.edit_text(
         f"⚠️ Вы уверены, что хотите <b>удалить</b> профиль?\n\n{message}",
-        reply_markup=kb
+        reply_markup=delete_confirm_keyboard(idx)
     )
-    await call.answer()
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("confirm_delete_"))
-async def on_profile_delete_final(call: CallbackQuery):
+@profile_router.callback_query(ProfileCB.filter(F.action == "confirm_delete"))
+async def on_profile_delete_final(call: CallbackQuery, callback_data: ProfileCB, config: dict):
     """
     Окончательно удаляет профиль после подтверждения.
     """
-    idx = int(call.data.split("_")[-1])
-    config = await get_valid_config(call.from_user.id)
+    idx = callback_data.idx
     deafult_added = ("\n➕ <b>Добавлен</b> стандартный профиль.\n"
                      "🚦 Статус изменён на 🔴 (неактивен)." if len(config["PROFILES"]) == 1 else "")
-    if len(config["PROFILES"]) == 1:
-        config["ACTIVE"] = False
-        await save_config(config)
     await remove_profile(config, idx, call.from_user.id)
     await call.message.edit_text(f"✅ <b>Профиль {idx + 1}</b> удалён.{deafult_added}", reply_markup=None)
-    await profiles_menu(call.message, call.from_user.id)
-    await call.answer()
+    await profiles_menu(call.message, call.from_user.id, config)
 
 
-@wizard_router.callback_query(lambda c: c.data.startswith("cancel_delete_"))
-async def on_profile_delete_cancel(call: CallbackQuery):
+@profile_router.callback_query(ProfileCB.filter(F.action == "cancel_delete"))
+async def on_profile_delete_cancel(call: CallbackQuery, callback_data: ProfileCB, config: dict):
     """
     Отмена удаления профиля.
     """
-    idx = int(call.data.split("_")[-1])
+    idx = callback_data.idx
     await call.message.edit_text(f"🚫 Удаление <b>профиля {idx + 1}</b> отменено.", reply_markup=None)
-    await profiles_menu(call.message, call.from_user.id)
-    await call.answer()
+    await profiles_menu(call.message, call.from_user.id, config)
 
 
 async def safe_edit_text(message, text, reply_markup=None):
@@ -1301,6 +1249,20 @@ async def safe_edit_text(message, text, reply_markup=None):
             raise
 
 
+async def safe_edit_text_by_id(bot: Bot, chat_id: int, message_id: int, text, reply_markup=None):
+    """
+    Редактирует сообщение по его id. Возвращает False, если Telegram отказал в правке
+    (сообщение удалено, устарело и т.п.) — тогда вызывающий код отправляет новое.
+    """
+    try:
+        await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+        return True
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            return True
+        return False
+
+
 @wizard_router.callback_query(F.data == "edit_config")
 async def edit_config_handler(call: CallbackQuery, state: FSMContext):
     """
@@ -1308,7 +1270,6 @@ async def edit_config_handler(call: CallbackQuery, state: FSMContext):
     """
     await call.message.answer("💰 Минимальная цена подарка, например: <code>5000</code>\n\n/cancel — отменить")
     await state.set_state(ConfigWizard.min_price)
-    await call.answer()
 
 
 @wizard_router.message(ConfigWizard.min_price)
@@ -1320,18 +1281,16 @@ async def step_min_price(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-        await state.update_data(MIN_PRICE=value)
-        await message.answer("💰 Максимальная цена подарка, например: <code>10000</code>\n\n/cancel — отменить")
-        await state.set_state(ConfigWizard.max_price)
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
+    await state.update_data(MIN_PRICE=value)
+    await message.answer("💰 Максимальная цена подарка, например: <code>10000</code>\n\n/cancel — отменить")
+    await state.set_state(ConfigWizard.max_price)
 
 
 @wizard_router.message(ConfigWizard.max_price)
@@ -1343,25 +1302,23 @@ async def step_max_price(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-
-        data = await state.get_data()
-        min_price = data.get("MIN_PRICE")
-        if min_price and value < min_price:
-            await message.answer("🚫 Максимальная цена не может быть меньше минимальной. Попробуйте ещё раз.\n\n/cancel — отмена")
-            return
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
 
-        await state.update_data(MAX_PRICE=value)
-        await message.answer("📦 Минимальный саплай подарка, например: <code>1000</code>\n\n/cancel — отменить")
-        await state.set_state(ConfigWizard.min_supply)
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    data = await state.get_data()
+    min_price = data.get("MIN_PRICE")
+    if min_price and value < min_price:
+        await message.answer("🚫 Максимальная цена не может быть меньше минимальной. Попробуйте ещё раз.\n\n/cancel — отмена")
+        return
+
+    await state.update_data(MAX_PRICE=value)
+    await message.answer("📦 Минимальный саплай подарка, например: <code>1000</code>\n\n/cancel — отменить")
+    await state.set_state(ConfigWizard.min_supply)
 
 
 @wizard_router.message(ConfigWizard.min_supply)
@@ -1373,18 +1330,16 @@ async def step_min_supply(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-        await state.update_data(MIN_SUPPLY=value)
-        await message.answer("📦 Максимальный саплай подарка, например: <code>10000</code>\n\n/cancel — отменить")
-        await state.set_state(ConfigWizard.max_supply)
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
+    await state.update_data(MIN_SUPPLY=value)
+    await message.answer("📦 Максимальный саплай подарка, например: <code>10000</code>\n\n/cancel — отменить")
+    await state.set_state(ConfigWizard.max_supply)
 
 
 @wizard_router.message(ConfigWizard.max_supply)
@@ -1396,25 +1351,23 @@ async def step_max_supply(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-
-        data = await state.get_data()
-        min_supply = data.get("MIN_SUPPLY")
-        if min_supply and value < min_supply:
-            await message.answer("🚫 Максимальный саплай не может быть меньше минимального. Попробуйте ещё раз.\n\n/cancel — отмена")
-            return
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
 
-        await state.update_data(MAX_SUPPLY=value)
-        await message.answer("🎁 Максимальное количество подарков, например: <code>5</code>\n\n/cancel — отменить")
-        await state.set_state(ConfigWizard.count)
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    data = await state.get_data()
+    min_supply = data.get("MIN_SUPPLY")
+    if min_supply and value < min_supply:
+        await message.answer("🚫 Максимальный саплай не может быть меньше минимального. Попробуйте ещё раз.\n\n/cancel — отмена")
+        return
+
+    await state.update_data(MAX_SUPPLY=value)
+    await message.answer("🎁 Максимальное количество подарков, например: <code>5</code>\n\n/cancel — отменить")
+    await state.set_state(ConfigWizard.count)
 
 
 @wizard_router.message(ConfigWizard.count)
@@ -1426,21 +1379,19 @@ async def step_count(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
 
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-        await state.update_data(COUNT=value)
-        await message.answer(
-            "⭐️ Введите лимит звёзд для этого профиля (например: <code>10000</code>)\n\n"
-            "/cancel — отменить"
-        )
-        await state.set_state(ConfigWizard.limit)
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
+    await state.update_data(COUNT=value)
+    await message.answer(
+        "⭐️ Введите лимит звёзд для этого профиля (например: <code>10000</code>)\n\n"
+        "/cancel — отменить"
+    )
+    await state.set_state(ConfigWizard.limit)
 
 
 @wizard_router.message(ConfigWizard.limit)
@@ -1452,28 +1403,26 @@ async def step_limit(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
 
-    try:
-        value = int(message.text)
-        if value <= 0:
-            raise ValueError
-        await state.update_data(LIMIT=value)
-        message_text = ("📥 Введите <b>получателя</b> подарка:\n\n"
-                        "🤖 Если <b>отправитель</b> <code>Бот</code> введите:\n"
-                        f"➤ <b>ID пользователя</b> (например ваш: <code>{message.from_user.id}</code>)\n"
-                        "➤ <b>username канала</b> (например: <code>@pepeksey</code>)\n\n"
-                        "👤 Если <b>отправитель</b> <code>Юзербот</code> введите:\n"
-                        "➤ <b>username</b> пользователя (например: <code>@kirill_nft</code>)\n"
-                        "➤ <b>username</b> канала (например: <code>@WyoxAutoBuy</code>)\n\n"
-                        "🔎 <b>Узнать ID пользователя</b> можно тут: @userinfobot\n\n"
-                        "⚠️ Чтобы аккаунт <code>Юзербота</code> отправил подарок на другой аккаунт, между аккаунтами должна быть переписка.\n\n"
-                        "/cancel — отменить")
-        await message.answer(message_text)
-        await state.set_state(ConfigWizard.user_id)
-    except ValueError:
-        await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.\n\n/cancel — отмена")
+    value = parse_positive_int(message.text)
+    if value is None:
+        await message.answer(_ERR_POSITIVE_INT)
+        return
+    await state.update_data(LIMIT=value)
+    message_text = ("📥 Введите <b>получателя</b> подарка:\n\n"
+                    "🤖 Если <b>отправитель</b> <code>Бот</code> введите:\n"
+                    f"➤ <b>ID пользователя</b> (например ваш: <code>{message.from_user.id}</code>)\n"
+                    "➤ <b>username канала</b> (например: <code>@pepeksey</code>)\n\n"
+                    "👤 Если <b>отправитель</b> <code>Юзербот</code> введите:\n"
+                    "➤ <b>username</b> пользователя (например: <code>@kirill_nft</code>)\n"
+                    "➤ <b>username</b> канала (например: <code>@WyoxAutoBuy</code>)\n\n"
+                    "🔎 <b>Узнать ID пользователя</b> можно тут: @userinfobot\n\n"
+                    "⚠️ Чтобы аккаунт <code>Юзербота</code> отправил подарок на другой аккаунт, между аккаунтами должна быть переписка.\n\n"
+                    "/cancel — отменить")
+    await message.answer(message_text)
+    await state.set_state(ConfigWizard.user_id)
 
 
 @wizard_router.callback_query(F.data == "deposit_menu")
@@ -1483,7 +1432,22 @@ async def deposit_menu(call: CallbackQuery, state: FSMContext):
     """
     await call.message.answer("💰 Введите сумму для пополнения, например: <code>5000</code>\n\n/cancel — отменить")
     await state.set_state(ConfigWizard.deposit_amount)
-    await call.answer()
+
+
+async def send_deposit_invoice(message: Message, amount: int):
+    """
+    Отправляет счёт на пополнение баланса на указанную сумму.
+    """
+    await message.answer_invoice(
+        title="Бот для подарков",
+        description="Пополнение баланса",
+        prices=[LabeledPrice(label=CURRENCY, amount=amount)],
+        provider_token="",  # Укажи свой токен
+        payload="stars_deposit",
+        currency=CURRENCY,
+        start_parameter="deposit",
+        reply_markup=payment_keyboard(amount=amount),
+    )
 
 
 @wizard_router.message(ConfigWizard.deposit_amount)
@@ -1495,27 +1459,15 @@ async def deposit_amount_input(message: Message, state: FSMContext):
         return
     
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
 
-    try:
-        amount = int(message.text)
-        if amount < 1 or amount > 10000:
-            raise ValueError
-        prices = [LabeledPrice(label=CURRENCY, amount=amount)]
-        await message.answer_invoice(
-            title="Бот для подарков",
-            description="Пополнение баланса",
-            prices=prices,
-            provider_token="",  # Укажи свой токен
-            payload="stars_deposit",
-            currency=CURRENCY,
-            start_parameter="deposit",
-            reply_markup=payment_keyboard(amount=amount),
-        )
-        await state.clear()
-    except ValueError:
+    amount = parse_positive_int(message.text)
+    if amount is None or amount > MAX_DEPOSIT:
         await message.answer("🚫 Введите число от 1 до 10000. Попробуйте ещё раз.\n\n/cancel — отмена")
+        return
+    await send_deposit_invoice(message, amount)
+    await state.clear()
 
 
 @wizard_router.callback_query(F.data == "refund_menu")
@@ -1531,7 +1483,6 @@ async def refund_menu(call: CallbackQuery, state: FSMContext):
                               "🚫 Вывести звёзды с <code>Юзербота</code> нельзя.\n\n"
                               "/cancel — отменить")
     await state.set_state(ConfigWizard.refund_id)
-    await call.answer()
 
 
 @wizard_router.message(ConfigWizard.refund_id)
@@ -1540,15 +1491,15 @@ async def refund_input(message: Message, state: FSMContext):
     Обработка возврата по ID транзакции. Также поддерживается команда /withdraw_all.
     """
     if not message.text:
-        await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n/cancel — отмена")
+        await message.answer(_ERR_TEXT_ONLY)
         return
     
-    if message.text and message.text.strip().lower() == "/withdraw_all":
+    if is_command(message.text, "/withdraw_all"):
         await state.clear()
         await withdraw_all_handler(message)
         return
     
-    if message.text and message.text.strip().lower() == "/refund":
+    if is_command(message.text, "/refund"):
         await state.clear()
         await refund_handler(message)
         return
@@ -1577,7 +1528,6 @@ async def guest_deposit_menu(call: CallbackQuery, state: FSMContext):
     """
     await call.message.answer("💰 Введите сумму для пополнения, например: <code>5000</code>")
     await state.set_state(ConfigWizard.guest_deposit_amount)
-    await call.answer()
 
 
 @wizard_router.message(ConfigWizard.guest_deposit_amount)
@@ -1592,25 +1542,12 @@ async def guest_deposit_amount_input(message: Message, state: FSMContext):
         await message.answer("🚫 Поддерживается только текстовый ввод данных.\n\n⚠️ Операция завершена, попробуйте заново.")
         return
 
-    try:
-        amount = int(message.text)
-        if amount < 1 or amount > 10000:
-            raise ValueError
-        prices = [LabeledPrice(label=CURRENCY, amount=amount)]
-        await message.answer_invoice(
-            title="Бот для подарков",
-            description="Пополнение баланса",
-            prices=prices,
-            provider_token="",  # Укажи свой токен
-            payload="stars_deposit",
-            currency=CURRENCY,
-            start_parameter="deposit",
-            reply_markup=payment_keyboard(amount=amount),
-        )
-        await state.clear()
-    except ValueError:
-        await state.clear()
+    amount = parse_positive_int(message.text)
+    await state.clear()
+    if amount is None or amount > MAX_DEPOSIT:
         await message.answer("🚫 Ожидается число от 1 до 10000.\n\n⚠️ Операция завершена, попробуйте заново.")
+        return
+    await send_deposit_invoice(message, amount)
         
 
 @wizard_router.message(Command("withdraw_all"))
@@ -1628,21 +1565,13 @@ async def withdraw_all_handler(message: Message):
         await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=message.from_user.id, message_id=message.message_id)
         return
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Да", callback_data="withdraw_all_confirm"),
-                InlineKeyboardButton(text="❌ Нет", callback_data="withdraw_all_cancel"),
-            ]
-        ]
-    )
     await message.answer(
         "⚠️ Вы уверены, что хотите вывести все звёзды?",
-        reply_markup=keyboard,
+        reply_markup=WITHDRAW_CONFIRM_KB,
     )
 
 
-@wizard_router.callback_query(lambda c: c.data == "withdraw_all_confirm")
+@wizard_router.callback_query(F.data == "withdraw_all_confirm")
 async def withdraw_all_confirmed(call: CallbackQuery):
     """
     Подтверждение и запуск процедуры возврата всех звёзд. Выводит отчёт пользователю.
@@ -1652,8 +1581,6 @@ async def withdraw_all_confirmed(call: CallbackQuery):
     async def send_status(msg):
         await call.message.answer(msg)
 
-    await call.answer()
-
     result = await refund_all_star_payments(
         bot=call.bot,
         user_id=call.from_user.id,
@@ -1678,13 +1605,12 @@ async def withdraw_all_confirmed(call: CallbackQuery):
     await update_menu(bot=call.bot, chat_id=call.message.chat.id, user_id=call.from_user.id, message_id=call.message.message_id)
 
 
-@wizard_router.callback_query(lambda c: c.data == "withdraw_all_cancel")
+@wizard_router.callback_query(F.data == "withdraw_all_cancel")
 async def withdraw_all_cancel(call: CallbackQuery):
     """
     Обработка отмены возврата всех звёзд.
     """
     await call.message.edit_text("🚫 Действие отменено.")
-    await call.answer()
     await update_menu(bot=call.bot, chat_id=call.message.chat.id, user_id=call.from_user.id, message_id=call.message.message_id)
 
 
@@ -1739,7 +1665,7 @@ async def try_cancel(message: Message, state: FSMContext) -> bool:
     """
     Проверка, ввёл ли пользователь /cancel, и отмена мастера, если да.
     """
-    if message.text and message.text.strip().lower() == "/cancel":
+    if is_command(message.text, "/cancel"):
         await state.clear()
         await message.answer("🚫 Действие отменено.")
         await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=message.from_user.id, message_id=message.message_id)
@@ -1772,6 +1698,28 @@ async def get_chat_type(bot: Bot, username: str):
     except Exception as e:
         logger.error(f"Ошибка при получении юзернейма канала: {e}")
         return "unknown"
+
+
+async def _cached_chat_type(bot: Bot, username: str, ttl: float = CHAT_TYPE_TTL) -> str:
+    """
+    Возвращает тип чата по username с кэшем на ttl секунд,
+    чтобы повторный ввод того же username не делал новый запрос к Telegram.
+    "unknown" не кэшируется: это может быть временная ошибка сети или API.
+    """
+    key = username.lower()
+    now = time.monotonic()
+    hit = _chat_type_cache.get(key)
+    if hit and now - hit[0] < ttl:
+        return hit[1]
+    if len(_chat_type_cache) >= CHAT_TYPE_CACHE_SIZE:
+        # Убираем устаревшие записи, а если их нет — самую старую
+        stale = [k for k, (ts, _) in _chat_type_cache.items() if now - ts >= ttl]
+        for k in stale or [next(iter(_chat_type_cache))]:
+            del _chat_type_cache[k]
+    chat_type = await get_chat_type(bot=bot, username=username)
+    if chat_type in CACHEABLE_CHAT_TYPES:
+        _chat_type_cache[key] = (now, chat_type)
+    return chat_type
     
 
 def register_wizard_handlers(dp):
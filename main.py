@@ -14,19 +14,25 @@ from aiohttp import web  # <<< NEW
 
 # --- Внутренние модули ---
 from services.config import (
-    ensure_config,
     save_config,
+    flush_config,
     get_valid_config,
     get_target_display,
     migrate_config_if_needed,
     add_allowed_user,
     DEFAULT_CONFIG,
     VERSION,
-    PURCHASE_COOLDOWN
+    PURCHASE_COOLDOWN,
+    PROGRESS_FLUSH_EVERY,
+    PROGRESS_WRITE_DELAY,
+    purchase_lock,
+    WORKER_IDLE_TIMEOUT,
+    worker_wakeup
 )
-from services.menu import update_menu
-from services.balance import refresh_balance
+from services.menu import update_menu, CB
+from services.balance import refresh_balance, get_balance_cached
 from services.gifts_manager import get_best_gift_list, userbot_gifts_updater
+from services.gifts_bot import get_available_gifts_cached, gifts_watcher
 from services.buy_bot import buy_gift
 from services.buy_userbot import buy_gift_userbot
 from services.userbot import try_start_userbot_from_config
@@ -37,10 +43,13 @@ from utils.logging import setup_logging
 from utils.proxy import get_aiohttp_session
 from middlewares.access_control import AccessControlMiddleware
 from middlewares.rate_limit import RateLimitMiddleware
+from middlewares.callback_dedup import CallbackDedupMiddleware
+from middlewares.outgoing_throttle import OutgoingThrottleMiddleware
 
 load_dotenv(override=False)
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 USER_ID = int(os.getenv("TELEGRAM_USER_ID"))
+REDIS_URL = os.getenv("REDIS_URL")
 default_config = DEFAULT_CONFIG(USER_ID)
 ALLOWED_USER_IDS = []
 ALLOWED_USER_IDS.append(USER_ID)
@@ -50,203 +59,294 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
+# Прогресс покупок, ещё не записанный в config.json: (индекс, id профиля) -> [куплено, потрачено]
+pending_progress: dict[tuple[int, str], list[int]] = {}
+progress_dirty = asyncio.Event()
+progress_lock = asyncio.Lock()
+
+
+def _find_profile(profiles: list, index: int, profile_id: str):
+    """
+    Ищет профиль по id, а если его уже нет — берёт профиль на прежнем месте.
+    Потраченные звёзды не теряются: иначе следующий проход превысил бы COUNT и LIMIT.
+    Возвращает None, только если не осталось ни профиля с этим id, ни профиля с этим индексом.
+    """
+    profile = next((p for p in profiles if p["ID"] == profile_id), None)
+    if profile is None and index < len(profiles):
+        logger.warning("Профиль %s не найден, прогресс записан в профиль #%d", profile_id, index + 1)
+        profile = profiles[index]
+    return profile
+
+
+def queue_profile_progress(profile_index: int, profile_id: str, bought: int, spent: int):
+    """
+    Откладывает запись прогресса профиля: фоновый писатель сохранит его вместе с остальными.
+    Воркер продолжает покупки, не дожидаясь записи на диск.
+    """
+    entry = pending_progress.setdefault((profile_index, profile_id), [0, 0])
+    entry[0] += bought
+    entry[1] += spent
+    progress_dirty.set()
+
+
+async def _apply_pending_progress(profile_key: tuple[int, str] = None, done: bool = False):
+    """
+    Накладывает весь отложенный прогресс на свежезагруженный конфиг и сохраняет его.
+    Изменения, сделанные параллельно (баланс, статус, правки профиля), не затираются.
+    Прогресс ищет свой профиль по id, поэтому удаление и перестановка профилей ему не мешают.
+    Возвращает конфиг и профиль profile_key (None, если его уже нет); при done отмечает его завершённым.
+    """
+    async with progress_lock:
+        config = await get_valid_config(USER_ID)
+        profiles = config["PROFILES"]
+        try:
+            for (index, profile_id), (bought, spent) in pending_progress.items():
+                profile = _find_profile(profiles, index, profile_id)
+                if profile is None:
+                    logger.error("Профиль %s удалён, прогресс некуда записать: %d шт., %d ★", profile_id, bought, spent)
+                    continue
+                profile["BOUGHT"] += bought
+                profile["SPENT"] += spent
+        finally:
+            pending_progress.clear()
+        profile = _find_profile(profiles, *profile_key) if profile_key else None
+        if done and profile is not None:
+            profile["DONE"] = True
+        await save_config(config)
+        return config, profile
+
+
+async def progress_writer_loop():
+    """
+    Фоновый писатель прогресса: серия покупок за PROGRESS_WRITE_DELAY схлопывается в одну запись.
+    """
+    while True:
+        await progress_dirty.wait()
+        await asyncio.sleep(PROGRESS_WRITE_DELAY)
+        progress_dirty.clear()
+        if pending_progress:
+            try:
+                await _apply_pending_progress()
+            except Exception as e:
+                logger.error(f"Ошибка записи прогресса покупок: {e}")
+
+
+async def flush_profile_progress(profile_index: int, profile_id: str, bought: int, spent: int, done: bool = False):
+    """
+    Сразу записывает прогресс профиля (и всё отложенное) в config.json одной записью.
+    Возвращает свежий конфиг и профиль (None, если профиль удалён).
+    """
+    queue_profile_progress(profile_index, profile_id, bought, spent)
+    return await _apply_pending_progress((profile_index, profile_id), done)
+
+
+def format_purchase_lines(purchases: dict[str, dict]) -> list[str]:
+    """
+    Строки отчёта по купленным подаркам: одна строка на подарок с ценой и количеством.
+    """
+    last = len(purchases) - 1
+    return [
+        f"{'   └' if idx == last else '   ├'} {data['price']:,} ★ × {data['count']}"
+        for idx, data in enumerate(purchases.values())
+    ]
+
+
+async def process_profile(bot, config: dict, profile_index: int, profile: dict):
+    """
+    Покупает подарки для одного профиля в пределах его COUNT и LIMIT.
+    Профили подбирают подарки параллельно, а сами покупки идут по одной через общий purchase_lock.
+    Возвращает (строки отчёта, был ли прогресс, были ли все попытки покупки успешными).
+    """
+    # Пропускаем профили с выключенным юзерботом
+    sender = profile.get("SENDER", "bot")
+    if sender == "userbot":
+        userbot_config = config.get("USERBOT", {})
+        if not userbot_config.get("ENABLED", False):
+            return [], False, True
+
+    COUNT = profile["COUNT"]
+    LIMIT = profile.get("LIMIT", 0)
+    TARGET_USER_ID = profile["TARGET_USER_ID"]
+    TARGET_CHAT_ID = profile["TARGET_CHAT_ID"]
+
+    filtered_gifts = await get_best_gift_list(bot, profile)
+
+    if not filtered_gifts:
+        return [], False, True
+
+    purchases: dict[str, dict] = {}  # gift_id -> {"price", "count"}
+    any_success = True
+    before_bought = profile["BOUGHT"]
+    before_spent = profile["SPENT"]
+    pending_bought = 0  # Покупки, ещё не записанные в config.json
+    pending_spent = 0
+    profile_id = profile["ID"]
+
+    for gift in filtered_gifts:
+        gift_id = gift["id"]
+        gift_price = gift["price"]
+        gift_total_count = gift["supply"]
+        sticker_file_id = gift["sticker_file_id"]
+
+        # Сколько штук этого подарка помещается в остаток COUNT и LIMIT — считаем один раз
+        max_by_count = COUNT - profile["BOUGHT"]
+        max_by_limit = (LIMIT - profile["SPENT"]) // gift_price if gift_price > 0 else max_by_count
+        for _ in range(min(max_by_count, max_by_limit)):
+            async with purchase_lock:
+                if sender == "bot":
+                    success = await buy_gift(
+                        bot=bot,
+                        env_user_id=USER_ID,
+                        gift_id=gift_id,
+                        user_id=TARGET_USER_ID,
+                        chat_id=TARGET_CHAT_ID,
+                        gift_price=gift_price,
+                        file_id=sticker_file_id
+                    )
+                elif sender == "userbot":
+                    success = await buy_gift_userbot(
+                        session_user_id=USER_ID,
+                        gift_id=gift_id,
+                        target_user_id=TARGET_USER_ID,
+                        target_chat_id=TARGET_CHAT_ID,
+                        gift_price=gift_price,
+                        file_id=sticker_file_id
+                    )
+                else:
+                    logger.warning(f"Неизвестный отправитель SENDER={sender} в профиле {profile_index}")
+                    success = False
+                if success:
+                    # Пауза под блокировкой: темп покупок общий для всех профилей
+                    await asyncio.sleep(PURCHASE_COOLDOWN)
+
+            if not success:
+                any_success = False
+                break  # Не удалось купить — пробуем следующий подарок
+
+            profile["BOUGHT"] += 1
+            profile["SPENT"] += gift_price
+            pending_bought += 1
+            pending_spent += gift_price
+            entry = purchases.setdefault(gift_id, {"price": gift_price, "count": 0})
+            entry["count"] += 1
+            if pending_bought >= PROGRESS_FLUSH_EVERY:
+                queue_profile_progress(profile_index, profile_id, pending_bought, pending_spent)
+                pending_bought = pending_spent = 0
+
+        if profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT:
+            break  # Достигли лимит либо по количеству, либо по сумме
+
+    after_bought = profile["BOUGHT"]
+    after_spent = profile["SPENT"]
+    made_local_progress = (after_bought > before_bought) or (after_spent > before_spent)
+    completed = (profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT) and not profile["DONE"]
+
+    # Остаток прогресса, отложенные записи и отметка о завершении — одной записью
+    if made_local_progress or completed:
+        _, stored = await flush_profile_progress(profile_index, profile_id, pending_bought, pending_spent, done=completed)
+        # Профиль удалили во время покупок — отчёт строим по локальным счётчикам
+        profile = stored or profile
+
+    # Профиль полностью выполнен: либо по количеству, либо по лимиту
+    if completed:
+        target_display = get_target_display(profile, USER_ID)
+        summary_lines = [
+            f"\n┌✅ <b>Профиль {profile_index+1}</b>\n"
+            f"├👤 <b>Получатель:</b> {target_display}\n"
+            f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
+            f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
+        ]
+        summary_lines += format_purchase_lines(purchases)
+        logger.info(f"Профиль #{profile_index+1} завершён")
+        return summary_lines, True, any_success
+
+    # Если ничего не куплено — баланс/лимит/подарки кончились
+    if (profile["BOUGHT"] < COUNT or profile["SPENT"] < LIMIT) and not profile["DONE"] and made_local_progress:
+        target_display = get_target_display(profile, USER_ID)
+        summary_lines = [
+            f"\n┌⚠️ <b>Профиль {profile_index+1}</b> (частично)\n"
+            f"├👤 <b>Получатель:</b> {target_display}\n"
+            f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
+            f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
+        ]
+        summary_lines += format_purchase_lines(purchases)
+        logger.warning(f"Профиль #{profile_index+1} не завершён")
+        return summary_lines, True, any_success
+
+    return [], False, any_success
+
+
 async def gift_purchase_worker(bot):
     """
     Фоновый воркер для покупки подарков по профилям.
     Теперь учитывает параметр LIMIT — максимальную сумму звёзд, которую можно потратить на профиль.
     Если лимит исчерпан — профиль считается завершённым и воркер переходит к следующему.
+    Незавершённые профили обрабатываются параллельно, покупки между ними идут по очереди.
     """
     await refresh_balance(bot)
     while True:
         try:
+            # Сбрасываем до чтения конфига: включение после этой точки не потеряется
+            worker_wakeup.clear()
             config = await get_valid_config(USER_ID)
 
             if not config["ACTIVE"]:
-                await asyncio.sleep(1)
+                # Бот выключен — спим до переключения статуса, не перечитывая конфиг
+                await worker_wakeup.wait()
                 continue
 
-            message = None
-            report_message_lines = []
-            progress_made = False  # Был ли прогресс по профилям на этом проходе
-            any_success = True
-
-            for profile_index, profile in enumerate(config["PROFILES"]):
-                # Пропускаем завершённые профили
-                if profile.get("DONE"):
-                    continue
-                # Пропускаем профили с выключенным юзерботом
-                sender = profile.get("SENDER", "bot")
-                if sender == "userbot":
-                    userbot_config = config.get("USERBOT", {})
-                    if not userbot_config.get("ENABLED", False):
-                        continue
-
-                COUNT = profile["COUNT"]
-                LIMIT = profile.get("LIMIT", 0)
-                TARGET_USER_ID = profile["TARGET_USER_ID"]
-                TARGET_CHAT_ID = profile["TARGET_CHAT_ID"]
-
-                filtered_gifts = await get_best_gift_list(bot, profile)
-
-                if not filtered_gifts:
-                    continue
+            # Один запрос списка подарков на проход: профили фильтруют его из кэша
+            await get_available_gifts_cached(bot)
+            outcomes = await asyncio.gather(*(
+                process_profile(bot, config, profile_index, profile)
+                for profile_index, profile in enumerate(config["PROFILES"])
+                if not profile.get("DONE")
+            ), return_exceptions=True)
+            # Ошибка одного профиля не прерывает остальные: проход завершается только вместе со всеми
+            results = []
+            for outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    logger.error(f"Ошибка обработки профиля: {outcome}")
+                else:
+                    results.append(outcome)
+            report_message_lines = [line for lines, _, _ in results for line in lines]
+            progress_made = any(progress for _, progress, _ in results)  # Был ли прогресс по профилям на этом проходе
+            any_success = all(success for _, _, success in results)
+            if progress_made:
+                # Профили сохранялись по отдельности — берём итоговое состояние с диска
+                config = await get_valid_config(USER_ID)
 
-                purchases = []
-                before_bought = profile["BOUGHT"]
-                before_spent = profile["SPENT"]
-
-                for gift in filtered_gifts:
-                    gift_id = gift["id"]
-                    gift_price = gift["price"]
-                    gift_total_count = gift["supply"]
-                    sticker_file_id = gift["sticker_file_id"]
-
-                    # Проверяем лимит перед каждой покупкой
-                    while (profile["BOUGHT"] < COUNT and
-                           profile["SPENT"] + gift_price <= LIMIT):
-
-                        sender = profile.get("SENDER", "bot")
-                        if sender == "bot":
-                            success = await buy_gift(
-                                bot=bot,
-                                env_user_id=USER_ID,
-                                gift_id=gift_id,
-                                user_id=TARGET_USER_ID,
-                                chat_id=TARGET_CHAT_ID,
-                                gift_price=gift_price,
-                                file_id=sticker_file_id
-                            )
-                        elif sender == "userbot":
-                            userbot_config = config.get("USERBOT", {})
-                            success = await buy_gift_userbot(
-                                session_user_id=USER_ID,
-                                gift_id=gift_id,
-                                target_user_id=TARGET_USER_ID,
-                                target_chat_id=TARGET_CHAT_ID,
-                                gift_price=gift_price,
-                                file_id=sticker_file_id
-                            )
-                        else:
-                            logger.warning(f"Неизвестный отправитель SENDER={sender} в профиле {profile_index}")
-                            success = False
-
-                        if not success:
-                            any_success = False
-                            break  # Не удалось купить — пробуем следующий подарок
-
-                        config = await get_valid_config(USER_ID)
-                        profile = config["PROFILES"][profile_index]
-                        profile["BOUGHT"] += 1
-                        profile["SPENT"] += gift_price
-                        purchases.append({"id": gift_id, "price": gift_price})
-                        await save_config(config)
-                        await asyncio.sleep(PURCHASE_COOLDOWN)
-
-                        # Проверяем: не достигли ли лимит после покупки
-                        if profile["SPENT"] >= LIMIT:
-                            break
-
-                    if profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT:
-                        break  # Достигли лимит либо по количеству, либо по сумме
-
-                after_bought = profile["BOUGHT"]
-                after_spent = profile["SPENT"]
-                made_local_progress = (after_bought > before_bought) or (after_spent > before_spent)
-
-                # Профиль полностью выполнен: либо по количеству, либо по лимиту
-                if (profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT) and not profile["DONE"]:
-                    config = await get_valid_config(USER_ID)
-                    profile = config["PROFILES"][profile_index]
-                    profile["DONE"] = True
-                    await save_config(config)
-
-                    target_display = get_target_display(profile, USER_ID)
-                    summary_lines = [
-                        f"\n┌✅ <b>Профиль {profile_index+1}</b>\n"
-                        f"├👤 <b>Получатель:</b> {target_display}\n"
-                        f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
-                        f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
-                    ]
-                    gift_summary = {}
-                    for p in purchases:
-                        key = p["id"]
-                        if key not in gift_summary:
-                            gift_summary[key] = {"price": p["price"], "count": 0}
-                        gift_summary[key]["count"] += 1
-
-                    gift_items = list(gift_summary.items())
-                    for idx, (gid, data) in enumerate(gift_items):
-                        prefix = "   └" if idx == len(gift_items) - 1 else "   ├"
-                        summary_lines.append(
-                            f"{prefix} {data['price']:,} ★ × {data['count']}"
-                        )
-                    report_message_lines += summary_lines
-
-                    logger.info(f"Профиль #{profile_index+1} завершён")
-                    progress_made = True
-                    await refresh_balance(bot)
-                    continue  # К следующему профилю
-
-                # Если ничего не куплено — баланс/лимит/подарки кончились
-                if (profile["BOUGHT"] < COUNT or profile["SPENT"] < LIMIT) and not profile["DONE"] and made_local_progress:
-                    target_display = get_target_display(profile, USER_ID)
-                    summary_lines = [
-                        f"\n┌⚠️ <b>Профиль {profile_index+1}</b> (частично)\n"
-                        f"├👤 <b>Получатель:</b> {target_display}\n"
-                        f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
-                        f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
-                    ]
-                    gift_summary = {}
-                    for p in purchases:
-                        key = p["id"]
-                        if key not in gift_summary:
-                            gift_summary[key] = {"price": p["price"], "count": 0}
-                        gift_summary[key]["count"] += 1
-
-                    gift_items = list(gift_summary.items())
-                    for idx, (gid, data) in enumerate(gift_items):
-                        prefix = "   └" if idx == len(gift_items) - 1 else "   ├"
-                        summary_lines.append(
-                            f"{prefix} {data['price']:,} ★ × {data['count']}"
-                        )
-                    report_message_lines += summary_lines
-
-                    logger.warning(f"Профиль #{profile_index+1} не завершён")
-                    progress_made = True
-                    await refresh_balance(bot)
-                    continue  # К следующему профилю
+            # После обработки всех профилей: одно сообщение и одно обновление меню за проход
+            report_parts = []
+            active = config["ACTIVE"]
 
             if not any_success and not progress_made:
                 logger.warning(
                     f"Не удалось купить ни один подарок ни в одном профиле (все попытки buy_gift были неудачны)"
                 )
-                config["ACTIVE"] = False
-                await save_config(config)
-                text = ("⚠️ Найдены подходящие подарки, но <b>не удалось</b> купить."
-                        "\n💰 Пополните баланс! Проверьте адрес получателя!"
-                        "\n🚦 Статус изменён на 🔴 (неактивен).")
-                message = await bot.send_message(chat_id=USER_ID, text=text)
-                await update_menu(
-                    bot=bot, chat_id=USER_ID, user_id=USER_ID, message_id=message.message_id
-                )            
+                active = False
+                report_parts.append("⚠️ Найдены подходящие подарки, но <b>не удалось</b> купить."
+                                    "\n💰 Пополните баланс! Проверьте адрес получателя!"
+                                    "\n🚦 Статус изменён на 🔴 (неактивен).")
 
-            # После обработки всех профилей:
             if progress_made:
-                config["ACTIVE"] = not all(p.get("DONE") for p in config["PROFILES"])
-                await save_config(config)
+                active = active and not all(p.get("DONE") for p in config["PROFILES"])
                 logger.info("Отчёт: хотя бы один профиль обработан, отправляем сводку.")
                 text = "🍀 <b>Отчёт по профилям:</b>\n"
                 text += "\n".join(report_message_lines) if report_message_lines else "⚠️ Покупок не совершено."
-                message = await bot.send_message(chat_id=USER_ID, text=text)
-                await update_menu(
-                    bot=bot, chat_id=USER_ID, user_id=USER_ID, message_id=message.message_id
-                )
+                report_parts.append(text)
+            elif active and all(p.get("DONE") for p in config["PROFILES"]):
+                active = False
+                report_parts.append("✅ Все профили <b>завершены</b>!\n⚠️ Нажмите ♻️ <b>Сбросить</b> или ✏️ <b>Изменить</b>!")
 
-            if all(p.get("DONE") for p in config["PROFILES"]) and config["ACTIVE"]:
-                config["ACTIVE"] = False
+            if active != config["ACTIVE"]:
+                config["ACTIVE"] = active
                 await save_config(config)
-                text = "✅ Все профили <b>завершены</b>!\n⚠️ Нажмите ♻️ <b>Сбросить</b> или ✏️ <b>Изменить</b>!"
-                message = await bot.send_message(chat_id=USER_ID, text=text)
+
+            if report_parts:
+                if progress_made:
+                    await get_balance_cached(bot)
+                message = await bot.send_message(chat_id=USER_ID, text="\n\n".join(report_parts))
                 await update_menu(
                     bot=bot, chat_id=USER_ID, user_id=USER_ID, message_id=message.message_id
                 )
@@ -254,7 +354,24 @@ async def gift_purchase_worker(bot):
         except Exception as e:
             logger.error(f"Ошибка в gift_purchase_worker: {e}")
 
-        await asyncio.sleep(0.5)
+        # Ждём изменения подарков или конфига; таймаут — страховка от пропущенного события
+        try:
+            await asyncio.wait_for(worker_wakeup.wait(), timeout=WORKER_IDLE_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+
+def create_fsm_storage():
+    """
+    Хранилище состояний FSM: Redis, если задан REDIS_URL (состояния мастеров переживают
+    перезапуск и доступны нескольким процессам), иначе — в памяти процесса.
+    """
+    if REDIS_URL:
+        # Импорт по требованию: пакет redis нужен только при использовании RedisStorage
+        from aiogram.fsm.storage.redis import RedisStorage
+        logger.info("FSM-хранилище: Redis.")
+        return RedisStorage.from_url(REDIS_URL)
+    return MemoryStorage()
 
 
 # --- Keepalive мини-сервер для Render + UptimeRobot ---  # <<< NEW
@@ -288,11 +405,13 @@ async def main() -> None:
     """
     logger.info("Бот запущен!")
     await migrate_config_if_needed(USER_ID)
-    await ensure_config(USER_ID)
+    # Создаёт config.json по умолчанию, если его нет, и приводит его к схеме
+    await get_valid_config(USER_ID)
 
     session = await get_aiohttp_session(USER_ID)
     bot = Bot(token=TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher(storage=MemoryStorage())
+    bot.session.middleware(OutgoingThrottleMiddleware(rate=29))
+    dp = Dispatcher(storage=create_fsm_storage())
     dp.message.middleware(RateLimitMiddleware(
         commands_limits={"/start": 10, "/withdraw_all": 10, "/refund": 10}, 
         allowed_user_ids=ALLOWED_USER_IDS
@@ -301,15 +420,23 @@ async def main() -> None:
         commands_limits={"guest_deposit_menu": 10},
         allowed_user_ids=ALLOWED_USER_IDS
     ))
-    dp.message.middleware(AccessControlMiddleware(ALLOWED_USER_IDS))
-    dp.callback_query.middleware(AccessControlMiddleware(ALLOWED_USER_IDS))
+    # Один экземпляр проверки доступа на оба типа событий
+    access_control = AccessControlMiddleware(frozenset(ALLOWED_USER_IDS))
+    dp.message.middleware(access_control)
+    dp.callback_query.middleware(access_control)
+    dp.callback_query.middleware(CallbackDedupMiddleware(
+        interval=0.5,
+        callbacks={CB.MAIN_MENU, CB.HELP, CB.BUY_TEST, CB.RESET, CB.TOGGLE}
+    ))
 
     register_wizard_handlers(dp)
     register_catalog_handlers(dp)
+    bot_user = await bot.get_me()
     register_main_handlers(
         dp=dp,
         bot=bot,
-        version=VERSION
+        version=VERSION,
+        bot_username=bot_user.username
     )
 
     # Запуск userbot, если сессия уже существует
@@ -317,13 +444,21 @@ async def main() -> None:
 
     # Фоновые задачи
     asyncio.create_task(gift_purchase_worker(bot))
+    asyncio.create_task(progress_writer_loop())
+    asyncio.create_task(gifts_watcher(bot))
     asyncio.create_task(userbot_gifts_updater(USER_ID))
 
     # <<< NEW: стартуем веб-сервер (порт $PORT) параллельно с polling
     asyncio.create_task(start_web_server())
 
     # Старт polling
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Не теряем отложенный прогресс покупок и несохранённый конфиг при остановке
+        if pending_progress:
+            await _apply_pending_progress()
+        await flush_config()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
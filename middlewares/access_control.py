@@ -7,20 +7,24 @@ from aiogram.types import CallbackQuery, Message, TelegramObject, InlineKeyboard
 
 logger = logging.getLogger(__name__)
 
+GUEST_MENU_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="💰 Пополнить", callback_data="guest_deposit_menu")]
+])
+
 class AccessControlMiddleware(BaseMiddleware):
     """
     Мидлварь доступа: разрешает работу только определённым user_id.
     Отклоняет все остальные запросы.
+    Список разрешённых user_id фиксируется при создании во frozenset для O(1) проверки.
     """
     FREE_CALLBACKS = {"guest_deposit_menu"}
     FREE_STATES = {"ConfigWizard:guest_deposit_amount"}
 
-    def __init__(self, allowed_user_ids: list[int]):
+    def __init__(self, allowed_user_ids: list[int] | frozenset[int]):
         """
-        :param allowed_user_ids: Список разрешённых user_id.
-        :param bot: Экземпляр бота.
+        :param allowed_user_ids: Разрешённые user_id (список или множество).
         """
-        self.allowed_user_ids = allowed_user_ids
+        self.allowed_user_ids = frozenset(allowed_user_ids)
         super().__init__()
 
     async def __call__(self, handler, event: TelegramObject, data: dict):
@@ -58,18 +62,11 @@ async def show_guest_menu(message: Message):
     """
     Показывает гостевое меню для неразрешённых пользователей.
     """
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="💰 Пополнить", callback_data="guest_deposit_menu")
-            ]
-        ]
-    )
     await message.answer(
         "✅ Вы можете <b>получать подарки</b> от этого бота.\n"
         "💰 Вы можете <b>пополнить</b> звёзды в бот.\n"
         "⛔️ У вас <b>нет доступа</b> к панели управления.\n\n"
         "<b>🤖 Исходный код: <a href=\"https://github.com/tgwyoxn/TelegramGiftBuyer\">GitHub</a></b>\n"
         "<b>🐸 Автор: @kirill_nft</b>\n<b>📢 Канал: @WyoxAutoBuy</b>",
-        reply_markup=kb
+        reply_markup=GUEST_MENU_KB
     )
@@ -0,0 +1,43 @@
+# --- Стандартные библиотеки ---
+import time
+import logging
+
+# --- Сторонние библиотеки ---
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, CallbackQuery
+
+logger = logging.getLogger(__name__)
+
+class CallbackDedupMiddleware(BaseMiddleware):
+    """
+    Мидлварь для отсечения повторных нажатий: если пользователь нажал ту же кнопку
+    повторно в пределах interval секунд, запрос тихо подтверждается и не обрабатывается.
+    Экономит исходящие запросы к Telegram при двойных и тройных тапах.
+    """
+    def __init__(self, interval: float = 0.5, callbacks: set[str] = None):
+        """
+        :param interval: Окно в секундах, в течение которого повторное нажатие считается дублем
+        :param callbacks: Набор callback_data, к которым применяется фильтр (None — ко всем)
+        """
+        self.interval = interval
+        self.callbacks = callbacks
+        self.last_click = {}  # (user_id, callback_data) -> timestamp
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        """
+        Пропускает первое нажатие и отбрасывает дубли, пришедшие слишком быстро.
+        """
+        if not isinstance(event, CallbackQuery) or event.from_user is None:
+            return await handler(event, data)
+
+        if self.callbacks is not None and event.data not in self.callbacks:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        key = (event.from_user.id, event.data)
+        if now - self.last_click.get(key, 0) < self.interval:
+            await event.answer()
+            return
+        self.last_click[key] = now
+
+        return await handler(event, data)
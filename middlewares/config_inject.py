@@ -0,0 +1,27 @@
+# --- Стандартные библиотеки ---
+import logging
+
+# --- Сторонние библиотеки ---
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+# --- Внутренние модули ---
+from services.config import get_valid_config
+
+logger = logging.getLogger(__name__)
+
+class ConfigMiddleware(BaseMiddleware):
+    """
+    Мидлварь конфигурации: загружает и валидирует config.json один раз на апдейт
+    и передаёт его в хендлер аргументом config.
+    Конфиг подгружается только для хендлеров, которые объявили параметр config.
+    """
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        """
+        Подставляет config в data, если он нужен хендлеру и ещё не загружен.
+        """
+        handler_object = data.get("handler")
+        user = data.get("event_from_user")
+        if user and handler_object and "config" in handler_object.params and "config" not in data:
+            data["config"] = await get_valid_config(user.id)
+        return await handler(event, data)
@@ -0,0 +1,109 @@
+# --- Стандартные библиотеки ---
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# --- Сторонние библиотеки ---
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import (
+    GetUpdates,
+    SendGift,
+    RefundStarPayment,
+    SendInvoice,
+    AnswerCallbackQuery,
+    AnswerPreCheckoutQuery
+)
+
+logger = logging.getLogger(__name__)
+
+# Флаг для второстепенных отправок: если токенов нет, запрос отбрасывается вместо ожидания
+drop_if_starved: ContextVar[bool] = ContextVar("drop_if_starved", default=False)
+
+# Методы, которые можно безопасно отбросить: правки и удаления сообщений
+DROPPABLE_PREFIXES = ("Edit", "Delete")
+
+# Методы вне лимита: покупки, возвраты, счета и ответы на колбэки не ждут в очереди за правками меню
+UNTHROTTLED_METHODS = (
+    GetUpdates,
+    SendGift,
+    RefundStarPayment,
+    SendInvoice,
+    AnswerCallbackQuery,
+    AnswerPreCheckoutQuery
+)
+
+
+class RequestDropped(Exception):
+    """
+    Второстепенный запрос отброшен из-за исчерпания лимита исходящих запросов.
+    """
+
+
+@contextmanager
+def non_critical():
+    """
+    Помечает исходящие запросы внутри блока как второстепенные (например, обновление меню).
+    При исчерпании лимита такие правки и удаления не отправляются, а остаток блока пропускается.
+    """
+    token = drop_if_starved.set(True)
+    try:
+        yield
+    except RequestDropped as e:
+        logger.debug("%s", e)
+    finally:
+        drop_if_starved.reset(token)
+
+
+class OutgoingThrottleMiddleware(BaseRequestMiddleware):
+    """
+    Мидлварь сессии бота: общий на весь бот token bucket для исходящих запросов.
+    Держит поток ниже лимита Telegram (~30 сообщений в секунду) и избавляет
+    хендлеры от ручных пауз. getUpdates, покупки и ответы на колбэки не ограничиваются.
+    """
+    def __init__(self, rate: float = 29, capacity: float = None):
+        """
+        :param rate: Скорость пополнения токенов (запросов в секунду)
+        :param capacity: Максимальный запас токенов для всплесков (по умолчанию равен rate)
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        """
+        Пополняет запас токенов пропорционально прошедшему времени.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def _acquire(self, droppable: bool) -> bool:
+        """
+        Забирает один токен. Возвращает False, если запрос можно отбросить, а токенов нет.
+        Токен резервируется сразу (запас может уйти в минус), а ожидание идёт без блокировки:
+        параллельные запросы выстраиваются по своим слотам, а не друг за другом.
+        """
+        self._refill()
+        if droppable and self.tokens < 1:
+            return False
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+        return True
+
+    async def __call__(self, make_request, bot, method):
+        """
+        Пропускает запрос при наличии токена, иначе ждёт или отбрасывает второстепенный.
+        """
+        if isinstance(method, UNTHROTTLED_METHODS):
+            return await make_request(bot, method)
+
+        name = type(method).__name__
+        droppable = drop_if_starved.get() and name.startswith(DROPPABLE_PREFIXES)
+        if not await self._acquire(droppable):
+            raise RequestDropped(f"Лимит исходящих запросов исчерпан, пропущен {name}.")
+
+        return await make_request(bot, method)
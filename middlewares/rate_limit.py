@@ -1,6 +1,7 @@
 # --- Стандартные библиотеки ---
 import time
 import logging
+from collections import OrderedDict
 
 # --- Сторонние библиотеки ---
 from aiogram import BaseMiddleware
@@ -14,50 +15,60 @@ class RateLimitMiddleware(BaseMiddleware):
     Применимо как к текстовым сообщениям (Message), так и к CallbackQuery.
 
     Ограничение действует отдельно для каждой команды и пользователя.
-    Пользователи из списка allowed_user_ids не ограничиваются.
+    Пользователи из allowed_user_ids не ограничиваются (хранятся во frozenset для O(1) проверки).
+    История вызовов хранится не более чем для max_users пользователей: давно неактивные вытесняются.
     """
-    def __init__(self, commands_limits: dict = None, allowed_user_ids: list[int] = None):
+    def __init__(self, commands_limits: dict = None, allowed_user_ids: list[int] = None, max_users: int = 50_000):
         """
         :param commands_limits: Словарь с лимитами в формате {команда: интервал_в_секундах}
         :param allowed_user_ids: Список user_id, которым разрешено игнорировать ограничения
+        :param max_users: Сколько пользователей держать в истории (LRU)
         """
-        self.last_times = {}  # user_id -> {command: timestamp}
-        self.commands_limits = commands_limits or {}  # command: seconds
-        self.allowed_user_ids = allowed_user_ids or []
+        self.last_times = OrderedDict()  # user_id -> {command: timestamp_ns}, порядок — по последнему вызову
+        self.max_users = max_users
+        # Интервалы сразу в наносекундах: дальше только целочисленная арифметика
+        self.commands_limits = {
+            cmd: int(seconds * 1_000_000_000) for cmd, seconds in (commands_limits or {}).items()
+        }  # command: nanoseconds
+        self.allowed_user_ids = frozenset(allowed_user_ids or ())
 
     async def __call__(self, handler, event: TelegramObject, data: dict):
         """
         Основной метод мидлвари: проверяет частоту вызовов команд/кнопок.
         Если превышен лимит — сообщение/запрос игнорируется и пользователю отправляется предупреждение.
         """
-        now = time.monotonic()
-        user_id = None
-        command = None
-
         if isinstance(event, Message):
-            user_id = event.from_user.id
-            command = event.text.split()[0] if event.text else None
+            text = event.text
+            # Обычные сообщения (не команды) не ограничиваются — самый частый случай
+            if not text or not text.startswith("/"):
+                return await handler(event, data)
+            command = text.split(maxsplit=1)[0]
         elif isinstance(event, CallbackQuery):
-            user_id = event.from_user.id
             command = event.data
+        else:
+            return await handler(event, data)
 
-        if user_id is None or command is None:
+        limit = self.commands_limits.get(command)
+        if limit is None:
             return await handler(event, data)
 
+        user_id = event.from_user.id
         if user_id in self.allowed_user_ids:
             return await handler(event, data)
 
-        for cmd, limit in self.commands_limits.items():
-            if command == cmd:
-                user_times = self.last_times.setdefault(user_id, {})
-                last = user_times.get(cmd, 0)
+        now = time.monotonic_ns()
+        user_times = self.last_times.setdefault(user_id, {})
+        last = user_times.get(command)
 
-                if now - last < limit:
-                    if isinstance(event, Message):
-                        await event.answer("⏳ Не спамьте, пожалуйста. Попробуйте чуть позже.")
-                    elif isinstance(event, CallbackQuery):
-                        await event.answer("⏳ Не спамьте, пожалуйста.", show_alert=True)
-                    return
-                user_times[cmd] = now
+        if last is not None and now - last < limit:
+            if isinstance(event, Message):
+                await event.answer("⏳ Не спамьте, пожалуйста. Попробуйте чуть позже.")
+            else:
+                await event.answer("⏳ Не спамьте, пожалуйста.", show_alert=True)
+            return
+        user_times[command] = now
+        self.last_times.move_to_end(user_id)
+        if len(self.last_times) > self.max_users:
+            self.last_times.popitem(last=False)
 
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
@@ -0,0 +1,38 @@
+# --- Стандартные библиотеки ---
+import json
+
+# --- Сторонние библиотеки ---
+try:
+    import orjson  # Быстрая C-сериализация JSON, если установлена
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        """
+        Сериализует объект в компактные JSON-байты.
+        """
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps_pretty(obj) -> bytes:
+        """
+        Сериализует объект в JSON-байты с отступом 2 — для ручного просмотра.
+        """
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj) -> bytes:
+        """
+        Сериализует объект в компактные JSON-байты (стандартный json, если orjson не установлен).
+        """
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def dumps_pretty(obj) -> bytes:
+        """
+        Сериализует объект в JSON-байты с отступом 2 — для ручного просмотра.
+        """
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+    loads = json.loads
@@ -1,9 +1,11 @@
 # --- Стандартные библиотеки ---
 from itertools import combinations
+import asyncio
 import logging
+import time
 
 # --- Внутренние модули ---
-from services.config import load_config, save_config
+from services.config import load_config, save_config, BALANCE_CACHE_TTL
 from services.userbot import get_userbot_stars_balance
 
 # --- Сторонние библиотеки ---
@@ -11,6 +13,11 @@ from aiogram.types.star_amount import StarAmount
 
 logger = logging.getLogger(__name__)
 
+# Последний полученный баланс и текущий запрос к API, общий для всех одновременных вызовов
+_balance_cache = {"ts": 0.0, "value": None, "task": None}
+# Чтение-изменение-запись балансов в конфиге по одному: одновременные списания не теряются
+_balance_lock = asyncio.Lock()
+
 async def get_stars_balance(bot) -> int:
     """
     Получает баланс звёзд через API бота (актуальный метод).
@@ -49,9 +56,51 @@ async def get_stars_balance_by_transactions(bot) -> int:
     return balance
 
 
+def _on_balance_done(task: asyncio.Task):
+    """
+    Снимает отметку о запросе в полёте и запоминает полученный баланс.
+    """
+    _balance_cache["task"] = None
+    if not task.cancelled() and task.exception() is None:
+        _balance_cache["value"] = task.result()
+        _balance_cache["ts"] = time.monotonic()
+
+
 async def refresh_balance(bot) -> int:
     """
     Обновляет и сохраняет баланс звёзд в конфиге, возвращает актуальное значение.
+    Одновременные вызовы ждут один и тот же запрос к API вместо отправки своих.
+    """
+    task = _balance_cache["task"]
+    if task is None:
+        task = asyncio.create_task(_fetch_and_store_balance(bot))
+        task.add_done_callback(_on_balance_done)
+        _balance_cache["task"] = task
+    # shield: отмена одного из ожидающих не прерывает общий запрос
+    return await asyncio.shield(task)
+
+
+async def get_balance_cached(bot, max_age: float = BALANCE_CACHE_TTL) -> int:
+    """
+    Возвращает баланс, полученный не более max_age секунд назад, иначе обновляет его.
+    Подходит для фоновых сводок воркера; меню, оплаты и возвраты используют refresh_balance.
+    """
+    if _balance_cache["value"] is not None and time.monotonic() - _balance_cache["ts"] < max_age:
+        return _balance_cache["value"]
+    return await refresh_balance(bot)
+
+
+def invalidate_balance_cache():
+    """
+    Помечает закэшированный баланс устаревшим (после списаний и пополнений).
+    """
+    _balance_cache["ts"] = 0.0
+
+
+async def _fetch_and_store_balance(bot) -> int:
+    """
+    Запрашивает балансы бота и юзербота и записывает их в конфиг.
+    Запросы к API идут до блокировки, под ней — только чтение и запись конфига.
     """
     # Загрузка конфига
     config = await load_config()
@@ -66,20 +115,22 @@ async def refresh_balance(bot) -> int:
     if has_session:
         try:
             userbot_balance = await get_userbot_balance()
-            config["USERBOT"]["BALANCE"] = userbot_balance
         except Exception as e:
-            config["USERBOT"]["BALANCE"] = 0
+            userbot_balance = 0
             logger.error(f"Не удалось получить баланс userbot: {e}")
     else:
         logger.info("Userbot-сессия неактивна или не настроена.")
-        config["USERBOT"]["BALANCE"] = 0
+        userbot_balance = 0
 
     # Баланс основного бота
     balance = await get_stars_balance(bot)
-    config["BALANCE"] = balance
 
-    # Сохраняем всё
-    await save_config(config)
+    # Сохраняем всё на свежем конфиге: за время запросов его могли изменить
+    async with _balance_lock:
+        config = await load_config()
+        config["USERBOT"]["BALANCE"] = userbot_balance
+        config["BALANCE"] = balance
+        await save_config(config)
     return balance
 
 
@@ -87,10 +138,12 @@ async def change_balance(delta: int) -> int:
     """
     Изменяет баланс звёзд в конфиге на указанное значение delta, не допуская отрицательных значений.
     """
-    config = await load_config()
-    config["BALANCE"] = max(0, config.get("BALANCE", 0) + delta)
-    balance = config["BALANCE"]
-    await save_config(config)
+    async with _balance_lock:
+        config = await load_config()
+        config["BALANCE"] = max(0, config.get("BALANCE", 0) + delta)
+        balance = config["BALANCE"]
+        await save_config(config)
+    invalidate_balance_cache()
     return balance
 
 
@@ -98,13 +151,15 @@ async def change_balance_userbot(delta: int) -> int:
     """
     Изменяет баланс звёзд юзербота в конфиге на указанное значение delta, не допуская отрицательных значений.
     """
-    config = await load_config()
-    userbot = config.get("USERBOT", {})
-    current = userbot.get("BALANCE", 0)
-    new_balance = max(0, current + delta)
-
-    config["USERBOT"]["BALANCE"] = new_balance
-    await save_config(config)
+    async with _balance_lock:
+        config = await load_config()
+        userbot = config.get("USERBOT", {})
+        current = userbot.get("BALANCE", 0)
+        new_balance = max(0, current + delta)
+
+        config["USERBOT"]["BALANCE"] = new_balance
+        await save_config(config)
+    invalidate_balance_cache()
     return new_balance
 
 
@@ -1,11 +1,14 @@
 # --- Стандартные библиотеки ---
-import json
+import asyncio
 import os
+import threading
 import logging
+import uuid
+from pathlib import Path
 from typing import Optional
 
-# --- Сторонние библиотеки ---
-import aiofiles
+# --- Внутренние модули ---
+from services._json import dumps, dumps_pretty, loads
 
 logger = logging.getLogger(__name__)
 
@@ -15,51 +18,88 @@ CONFIG_PATH = "config.json"
 DEV_MODE = False # Покупка тестовых подарков
 MAX_PROFILES = 5 # Максимальная длина сообщения 4096 символов
 PURCHASE_COOLDOWN = 0.3 # Количество покупок в секунду
+PROGRESS_FLUSH_EVERY = 5 # Через сколько покупок прогресс профиля записывается в config.json
+WORKER_IDLE_TIMEOUT = 30 # Максимальная пауза воркера без событий (в секундах)
+CONFIG_WRITE_DELAY = 0.2 # Окно схлопывания записей config.json на диск (в секундах)
+PROGRESS_WRITE_DELAY = 0.2 # Окно схлопывания фоновых записей прогресса (в секундах)
+BALANCE_CACHE_TTL = 2.0 # Сколько секунд баланс звёзд считается свежим для меню и отчётов воркера
+GIFTS_WATCH_INTERVAL = 1.0 # Период опроса подарков при включённом боте — задержка обнаружения дропа (в секундах)
+GIFTS_CACHE_TTL = 0.9 # Чуть меньше GIFTS_WATCH_INTERVAL: каждый опрос свежий, проход воркера переиспользует ответ
 USERBOT_UPDATE_COOLDOWN = 50 # Базовая величина ожидания в секундах для запроса списка подарков через юзербот
 ALLOWED_USER_IDS = []
+# Последние записанные/прочитанные байты каждого файла конфига: для пропуска записи без изменений
+_LAST_BYTES: dict[str, bytes] = {}
+# Отложенная запись: путь -> байты, которые ещё не попали на диск
+_pending_writes: dict[str, bytes] = {}
+# Снимок, который прямо сейчас записывается на диск: до конца записи читатели берут его, а не старый файл
+_inflight: dict[str, bytes] = {}
+# Число завершённых записей каждого файла: чтение, пересёкшееся с записью, не обновляет _LAST_BYTES
+_write_generation: dict[str, int] = {}
+_flush_task: Optional[asyncio.Task] = None
+_write_lock = asyncio.Lock()
+# Общая очередь покупок воркера, каталога и теста: проверка баланса, покупка и списание идут по одной,
+# а PURCHASE_COOLDOWN выдерживается между любыми двумя покупками бота, а не внутри каждого профиля
+purchase_lock = asyncio.Lock()
+# Будит воркер покупок, ожидающий включения ACTIVE
+worker_wakeup = asyncio.Event()
+# Пользователь изменил статус, профили, юзербот или баланс: наблюдатель подарков ждёт его, пока бот выключен
+config_changed = asyncio.Event()
 
 def add_allowed_user(user_id):
     ALLOWED_USER_IDS.append(user_id)
 
+# Значения по умолчанию, не зависящие от пользователя (все неизменяемые — можно разделять)
+_PROFILE_STATIC = {
+    "ID": None,
+    "NAME": None,
+    "MIN_PRICE": 5000,
+    "MAX_PRICE": 10000,
+    "MIN_SUPPLY": 1000,
+    "MAX_SUPPLY": 10000,
+    "LIMIT": 1000000,
+    "COUNT": 5,
+    "TARGET_USER_ID": None,
+    "TARGET_CHAT_ID": None,
+    "TARGET_TYPE": None,
+    "SENDER": "bot",
+    "BOUGHT": 0,
+    "SPENT": 0,
+    "DONE": False
+}
+_CONFIG_STATIC = {
+    "BALANCE": 0,
+    "ACTIVE": False,
+    "LAST_MENU_MESSAGE_ID": None,
+}
+_USERBOT_STATIC = {
+    "API_ID": None,
+    "API_HASH": None,
+    "PHONE": None,
+    "USER_ID": None,
+    "USERNAME": None,
+    "BALANCE": 0,
+    "ENABLED": False
+}
+
+def new_profile_id() -> str:
+    """Уникальный id профиля: не меняется при правках, удалении и перестановке других профилей."""
+    return uuid.uuid4().hex
+
 def DEFAULT_PROFILE(user_id: int) -> dict:
     """Создаёт профиль с дефолтными настройками для указанного пользователя."""
-    return {
-        "NAME": None,
-        "MIN_PRICE": 5000,
-        "MAX_PRICE": 10000,
-        "MIN_SUPPLY": 1000,
-        "MAX_SUPPLY": 10000,
-        "LIMIT": 1000000,
-        "COUNT": 5,
-        "TARGET_USER_ID": user_id,
-        "TARGET_CHAT_ID": None,
-        "TARGET_TYPE": None,
-        "SENDER": "bot",
-        "BOUGHT": 0,
-        "SPENT": 0,
-        "DONE": False
-    }
+    return {**_PROFILE_STATIC, "ID": new_profile_id(), "TARGET_USER_ID": user_id}
 
 def DEFAULT_CONFIG(user_id: int) -> dict:
     """Дефолтная конфигурация: глобальные поля + список профилей."""
     return {
-        "BALANCE": 0,
-        "ACTIVE": False,
-        "LAST_MENU_MESSAGE_ID": None,
+        **_CONFIG_STATIC,
         "PROFILES": [DEFAULT_PROFILE(user_id)],
-        "USERBOT": {
-            "API_ID": None,
-            "API_HASH": None,
-            "PHONE": None,
-            "USER_ID": None,
-            "USERNAME": None,
-            "BALANCE": 0,
-            "ENABLED": False
-        }
+        "USERBOT": dict(_USERBOT_STATIC)
     }
 
 # Типы и требования для каждого поля профиля
 PROFILE_TYPES = {
+    "ID": (str, False),
     "NAME": (str, True),
     "MIN_PRICE": (int, False),
     "MAX_PRICE": (int, False),
@@ -86,6 +126,19 @@ CONFIG_TYPES = {
 }
 
 
+_MISSING = object()
+# Плоская схема профиля для валидации: (ключ, тип, допустим ли None, значение по умолчанию)
+_PROFILE_SPEC = tuple(
+    (key, expected_type, allow_none, _PROFILE_STATIC[key])
+    for key, (expected_type, allow_none) in PROFILE_TYPES.items()
+)
+
+
+_EXPECTED_TOP = frozenset(CONFIG_TYPES)
+_EXPECTED_PROFILE = frozenset(PROFILE_TYPES)
+_EXPECTED_USERBOT = frozenset(_USERBOT_STATIC)
+
+
 def is_valid_type(value, expected_type, allow_none=False):
     """
     Проверяет тип значения с учётом допуска None.
@@ -95,78 +148,226 @@ def is_valid_type(value, expected_type, allow_none=False):
     return isinstance(value, expected_type)
 
 
-async def ensure_config(user_id: int, path: str = CONFIG_PATH):
+async def load_config(path: str = CONFIG_PATH) -> dict:
     """
-    Гарантирует существование config.json.
+    Загружает конфиг из файла (без валидации). Гарантирует, что файл существует.
+    Если есть ещё не записанное сохранение — возвращает его, а не устаревший файл.
     """
-    if not os.path.exists(path):
-        async with aiofiles.open(path, mode="w", encoding="utf-8") as f:
-            await f.write(json.dumps(DEFAULT_CONFIG(user_id), indent=2))
-        logger.info(f"Создана конфигурация: {path}")
+    if not _config_exists(path):
+        raise FileNotFoundError(f"Файл {path} не найден. Используйте get_valid_config.")
+    return await _read_config(path)
 
 
-async def load_config(path: str = CONFIG_PATH) -> dict:
+def _config_exists(path: str) -> bool:
     """
-    Загружает конфиг из файла (без валидации). Гарантирует, что файл существует.
+    Есть ли конфиг: отложенный или записываемый снимок либо файл на диске.
     """
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Файл {path} не найден. Используйте ensure_config.")
-    async with aiofiles.open(path, mode="r", encoding="utf-8") as f:
-        data = await f.read()
-        return json.loads(data)
+    return path in _pending_writes or path in _inflight or os.path.exists(path)
+
+
+def _unwritten_bytes(path: str) -> Optional[bytes]:
+    """
+    Самый свежий снимок, которого ещё нет на диске: отложенный, иначе записываемый сейчас.
+    """
+    data = _pending_writes.get(path)
+    return data if data is not None else _inflight.get(path)
+
+
+async def _read_config(path: str) -> dict:
+    """
+    Читает конфиг без проверки существования: снимок, ещё не дошедший до диска, если он есть, иначе файл.
+    """
+    data = _unwritten_bytes(path)
+    if data is not None:
+        return loads(data)
+    generation = _write_generation.get(path, 0)
+    # Файл маленький: одно чтение целиком за один переход в поток
+    data = await asyncio.to_thread(Path(path).read_bytes)
+    # Если за время чтения началась или завершилась запись, прочитанное может уже не совпадать с диском
+    if path not in _inflight and _write_generation.get(path, 0) == generation:
+        _LAST_BYTES[path] = data
+    return loads(data)
+
+
+def _write_bytes(path: str, data: bytes):
+    """
+    Синхронная атомарная запись байтов: во временный файл, затем os.replace.
+    Обрыв процесса посреди записи не оставит повреждённый config.json. Вызывается из отдельного потока.
+    """
+    # Свой временный файл на поток: параллельные сохранения не пишут в один и тот же файл
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    # Низкоуровневая запись без буферизованного файлового объекта
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
 
 
 async def save_config(config: dict, path: str = CONFIG_PATH):
     """
     Сохраняет конфиг в файл.
+    Сериализация идёт сразу в цикле событий (снимок не пересекается с изменениями из хендлеров),
+    а запись на диск откладывается на CONFIG_WRITE_DELAY: серия сохранений даёт одну запись.
+    До записи load_config отдаёт этот снимок, поэтому чтение-изменение-запись не теряет изменений.
+    Если содержимое совпадает с последним прочитанным или сохранённым — сохранение пропускается.
+    """
+    global _flush_task
+    data = dumps(config)
+    # Сравниваем с ещё не записанным снимком, а если его нет — с тем, что уже на диске
+    current = _unwritten_bytes(path)
+    if (current if current is not None else _LAST_BYTES.get(path)) == data:
+        return
+    _pending_writes[path] = data
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_delayed_flush())
+    logger.info("Конфигурация сохранена.")
+
+
+def notify_config_changed():
+    """
+    Будит воркер покупок и наблюдатель подарков после изменений, влияющих на покупки:
+    статус, профили, юзербот, пополнение баланса. Вызывается там, где эти изменения делаются,
+    а не на каждом сохранении — записи прогресса и баланса самим воркером его не будят.
     """
-    async with aiofiles.open(path, mode="w", encoding="utf-8") as f:
-        await f.write(json.dumps(config, indent=2))
-    logger.info(f"Конфигурация сохранена.")
+    worker_wakeup.set()
+    config_changed.set()
 
 
-async def validate_profile(profile: dict, user_id: Optional[int] = None) -> dict:
+async def save_config_pretty(config: dict, path: str = CONFIG_PATH):
+    """
+    Сразу записывает конфиг с отступами — для ручной отладки config.json.
+    Обычные сохранения пишут компактный JSON.
+    """
+    await flush_config()
+    data = dumps_pretty(config)
+    async with _write_lock:
+        await _write_tracked(path, data)
+
+
+async def _delayed_flush():
+    """
+    Ждёт окно схлопывания и записывает накопленные сохранения.
+    """
+    await asyncio.sleep(CONFIG_WRITE_DELAY)
+    await flush_config()
+
+
+async def flush_config():
+    """
+    Сразу записывает на диск все отложенные сохранения (например, при остановке бота).
+    Записи идут строго по очереди, поэтому на диске всегда оказывается последний снимок.
+    Неудачная запись сразу возвращается в очередь и повторяется при следующем сохранении или flush.
+    """
+    failed: set[str] = set()
+    async with _write_lock:
+        while True:
+            path = next((p for p in _pending_writes if p not in failed), None)
+            if path is None:
+                break
+            data = _pending_writes.pop(path)
+            try:
+                await _write_tracked(path, data)
+            except Exception as e:
+                logger.error("Не удалось записать конфигурацию %s: %s", path, e)
+                failed.add(path)
+                # Более новый снимок, сохранённый во время записи, важнее неудачного
+                _pending_writes.setdefault(path, data)
+
+
+async def _write_tracked(path: str, data: bytes):
+    """
+    Записывает снимок на диск, пока читатели видят его через _inflight.
+    Только байты, действительно попавшие на диск, считаются записанными.
+    Вызывается под _write_lock.
+    """
+    _inflight[path] = data
+    try:
+        await asyncio.to_thread(_write_bytes, path, data)
+        _LAST_BYTES[path] = data
+        _write_generation[path] = _write_generation.get(path, 0) + 1
+    finally:
+        del _inflight[path]
+
+
+def validate_profile(profile: dict, user_id: Optional[int] = None) -> dict:
     """
     Валидирует один профиль.
     """
     valid = {}
-    default = DEFAULT_PROFILE(user_id or 0)
-    for key, (expected_type, allow_none) in PROFILE_TYPES.items():
-        if key not in profile or not is_valid_type(profile[key], expected_type, allow_none):
-            valid[key] = default[key]
-        else:
-            valid[key] = profile[key]
+    for key, expected_type, allow_none, default in _PROFILE_SPEC:
+        value = profile.get(key, _MISSING)
+        # Проверка типа встроена: без вызова is_valid_type на каждое поле
+        if value is _MISSING or (not allow_none if value is None else not isinstance(value, expected_type)):
+            if key == "TARGET_USER_ID":
+                value = user_id or 0
+            elif key == "ID":
+                value = new_profile_id()
+            else:
+                value = default
+        valid[key] = value
     return valid
 
 
-async def validate_config(config: dict, user_id: int) -> dict:
+def _looks_valid(config: dict) -> bool:
+    """
+    Быстрая проверка, что конфиг уже соответствует схеме: ключи совпадают, типы верные.
+    Ничего не копирует; при любом расхождении нужна полная validate_config.
+    """
+    if config.keys() != _EXPECTED_TOP:
+        return False
+    for key, (expected_type, allow_none) in CONFIG_TYPES.items():
+        if not is_valid_type(config[key], expected_type, allow_none):
+            return False
+    if config["USERBOT"].keys() != _EXPECTED_USERBOT:
+        return False
+    profiles = config["PROFILES"]
+    if not profiles:
+        return False
+    seen_ids = set()
+    for profile in profiles:
+        if not isinstance(profile, dict) or profile.keys() != _EXPECTED_PROFILE:
+            return False
+        if profile["ID"] in seen_ids:
+            return False
+        seen_ids.add(profile["ID"])
+        for key, expected_type, allow_none, _ in _PROFILE_SPEC:
+            value = profile[key]
+            if not allow_none if value is None else not isinstance(value, expected_type):
+                return False
+    return True
+
+
+def validate_config(config: dict, user_id: int) -> dict:
     """
     Валидирует глобальный конфиг и все профили.
     """
     valid = {}
-    default = DEFAULT_CONFIG(user_id)
     # Верхний уровень
     for key, (expected_type, allow_none) in CONFIG_TYPES.items():
         if key == "PROFILES":
             profiles = config.get("PROFILES", [])
             # Валидация профилей
-            valid_profiles = []
-            for profile in profiles:
-                valid_profiles.append(await validate_profile(profile, user_id))
-            if not valid_profiles:
-                valid_profiles = [DEFAULT_PROFILE(user_id)]
-            valid["PROFILES"] = valid_profiles
+            valid["PROFILES"] = [validate_profile(profile, user_id) for profile in profiles] or [DEFAULT_PROFILE(user_id)]
+            # id профилей должны быть уникальны: у скопированного вручную профиля id заменяется
+            seen_ids = set()
+            for profile in valid["PROFILES"]:
+                if profile["ID"] in seen_ids:
+                    profile["ID"] = new_profile_id()
+                seen_ids.add(profile["ID"])
         elif key == "USERBOT":
             userbot_data = config.get("USERBOT", {})
-            default_userbot = default["USERBOT"]
             valid_userbot = {}
-            for sub_key, default_value in default_userbot.items():
+            for sub_key, default_value in _USERBOT_STATIC.items():
                 value = userbot_data.get(sub_key, default_value)
                 valid_userbot[sub_key] = value
             valid["USERBOT"] = valid_userbot
         else:
             if key not in config or not is_valid_type(config[key], expected_type, allow_none):
-                valid[key] = default[key]
+                valid[key] = _CONFIG_STATIC[key]
             else:
                 valid[key] = config[key]
     return valid
@@ -175,10 +376,18 @@ async def validate_config(config: dict, user_id: int) -> dict:
 async def get_valid_config(user_id: int, path: str = CONFIG_PATH) -> dict:
     """
     Загружает, валидирует и при необходимости обновляет config.json.
+    Если файла нет — сохраняет и сразу возвращает конфиг по умолчанию, без повторного чтения.
     """
-    await ensure_config(user_id, path)
-    config = await load_config(path)
-    validated = await validate_config(config, user_id)
+    if not _config_exists(path):
+        config = DEFAULT_CONFIG(user_id)
+        await save_config(config, path)
+        logger.info("Создана конфигурация: %s", path)
+        return config
+    config = await _read_config(path)
+    # Обычный случай: конфиг уже корректен — без пересборки и глубокого сравнения
+    if _looks_valid(config):
+        return config
+    validated = validate_config(config, user_id)
     # Если валидированная версия отличается, сохранить
     if validated != config:
         await save_config(validated, path)
@@ -190,17 +399,16 @@ async def migrate_config_if_needed(user_id: int, path: str = CONFIG_PATH):
     Проверяет и преобразует config.json из старого формата (без PROFILES)
     в новый (список профилей). Работает асинхронно.
     """
-    if not os.path.exists(path):
+    if not _config_exists(path):
         return
 
     try:
-        async with aiofiles.open(path, "r", encoding="utf-8") as f:
-            data = await f.read()
-            config = json.loads(data)
+        # Через _read_config: отложенный или записываемый снимок важнее файла на диске
+        config = await _read_config(path)
     except Exception:
-        logger.error(f"Конфиг {path} повреждён.")
+        logger.error("Конфиг %s повреждён.", path)
         os.remove(path)
-        logger.error(f"Повреждённый конфиг {path} удалён.")
+        logger.error("Повреждённый конфиг %s удалён.", path)
         return
 
     # Если уже новый формат, ничего не делаем
@@ -232,15 +440,14 @@ async def migrate_config_if_needed(user_id: int, path: str = CONFIG_PATH):
         "PROFILES": [profile],
     }
 
-    async with aiofiles.open(path, "w", encoding="utf-8") as f:
-        await f.write(json.dumps(new_config, ensure_ascii=False, indent=2))
-    logger.info(f"Конфиг {path} мигрирован в новый формат.")
+    await save_config(new_config, path)
+    logger.info("Конфиг %s мигрирован в новый формат.", path)
 
 
 # ------------- Работа с профилями -----------------
 
 
-async def get_profile(config: dict, index: int = 0) -> dict:
+def get_profile(config: dict, index: int = 0) -> dict:
     """
     Получить профиль по индексу (по умолчанию первый).
     """
@@ -254,9 +461,15 @@ async def add_profile(config: dict, profile: dict, save: bool = True) -> dict:
     """
     Добавляет новый профиль в конфиг.
     """
-    config.setdefault("PROFILES", []).append(profile)
+    profiles = config.get("PROFILES")
+    if profiles is None:
+        config["PROFILES"] = profiles = []
+    # Новый профиль всегда получает свой id, даже если собран из копии существующего
+    profile["ID"] = new_profile_id()
+    profiles.append(profile)
     if save:
         await save_config(config)
+        notify_config_changed()
     return config
 
 
@@ -266,15 +479,19 @@ async def update_profile(config: dict, index: int, new_profile: dict, save: bool
     """
     if "PROFILES" not in config or index >= len(config["PROFILES"]):
         raise IndexError("Профиль не найден")
+    # Обновлённый профиль остаётся тем же профилем: id сохраняется
+    new_profile["ID"] = config["PROFILES"][index].get("ID") or new_profile_id()
     config["PROFILES"][index] = new_profile
     if save:
         await save_config(config)
+        notify_config_changed()
     return config
 
 
-async def remove_profile(config: dict, index: int, user_id: int, save: bool = True) -> dict:
+async def remove_profile(config: dict, index: int, user_id: int, save: bool = True, deactivate_if_last: bool = True) -> dict:
     """
     Удаляет профиль по индексу.
+    Если удалён последний профиль, добавляет стандартный и (при deactivate_if_last) выключает покупки.
     """
     if "PROFILES" not in config or index >= len(config["PROFILES"]):
         raise IndexError("Профиль не найден")
@@ -282,13 +499,40 @@ async def remove_profile(config: dict, index: int, user_id: int, save: bool = Tr
     if not config["PROFILES"]:
         # Добавить дефолтный если удалили все
         config["PROFILES"].append(DEFAULT_PROFILE(user_id))
+        if deactivate_if_last:
+            config["ACTIVE"] = False
     if save:
         await save_config(config)
+        notify_config_changed()
     return config
 
 
 # ------------- Форматирование ---------------------
 
+# Шаблон строки профиля в главном меню: поля профиля подставляются по именам
+_SUMMARY_PROFILE_TMPL = (
+    "\n"
+    "┌🏷️ <b>{name}</b>{userbot_state}{state}\n"
+    "├💰 <b>Цена</b>: {MIN_PRICE:,} – {MAX_PRICE:,} ★\n"
+    "├📦 <b>Саплай</b>: {MIN_SUPPLY:,} – {MAX_SUPPLY:,}\n"
+    "├🎁 <b>Куплено</b>: {BOUGHT:,} / {COUNT:,}\n"
+    "├⭐️ <b>Лимит</b>: {SPENT:,} / {LIMIT:,} ★\n"
+    "├👤 <b>Получатель</b>: {target}\n"
+    "└📤 <b>Отправитель</b>: {sender}"
+)
+# Готовые строки меню, не зависящие от данных
+_STATUS_LINES = {
+    True: "🚦 <b>Статус:</b> 🟢 Активен",
+    False: "🚦 <b>Статус:</b> 🔴 Неактивен",
+}
+_STATE_DONE = " ✅ <b>(завершён)</b>"
+_STATE_PARTIAL = " ⚠️ <b>(частично)</b>"
+_MUTED = " 🔕"
+_SENDER_BOT = "<code>Бот</code>"
+_SENDER_USERBOT = "<code>Юзербот</code>"
+_USERBOT_BALANCE_LINE = "💰 <b>Баланс юзербота</b>: {balance:,} ★{muted}"
+_USERBOT_NOT_CONNECTED = "💰 <b>Баланс юзербота</b>: Не подключён!"
+
 
 def format_config_summary(config: dict, user_id: int) -> str:
     """
@@ -297,49 +541,44 @@ def format_config_summary(config: dict, user_id: int) -> str:
     :param user_id: ID пользователя для отображения "Вы"
     :return: Готовый HTML-текст для меню
     """
-    status_text = "🟢 Активен" if config.get("ACTIVE") else "🔴 Неактивен"
     balance = config.get("BALANCE", 0)
     profiles = config.get("PROFILES", [])
     userbot = config.get("USERBOT", {})
     userbot_balance = userbot.get("BALANCE", 0)
     session_state = True if userbot.get("API_ID") and userbot.get("API_HASH") and userbot.get("PHONE") else False
 
-    lines = [f"🚦 <b>Статус:</b> {status_text}"]
+    lines = [_STATUS_LINES[bool(config.get("ACTIVE"))]]
+    user_id_str = str(user_id)  # Один раз на всё меню, а не на каждый профиль
     for idx, profile in enumerate(profiles, 1):
-        target_display = get_target_display(profile, user_id)
-        sender = '<code>Бот</code>' if profile['SENDER'] == 'bot' else f'<code>Юзербот</code>'
+        target_display = _target_display(profile, user_id_str)
+        sender = _SENDER_BOT if profile['SENDER'] == 'bot' else _SENDER_USERBOT
         profile_name = f'Профиль {idx}' if  not profile['NAME'] else profile['NAME']
         state_profile = (
-            " ✅ <b>(завершён)</b>" if profile.get('DONE')
-            else " ⚠️ <b>(частично)</b>" if profile.get('SPENT', 0) > 0
+            _STATE_DONE if profile.get('DONE')
+            else _STATE_PARTIAL if profile.get('SPENT', 0) > 0
             else ""
         )
-        userbot_state_profile = ' 🔕' if profile['SENDER'] == 'userbot' and (not session_state or userbot.get('ENABLED') == False) else ''
-        line = (
-            "\n"
-            f"┌🏷️ <b>{profile_name}</b>{userbot_state_profile}{state_profile}\n"
-            f"├💰 <b>Цена</b>: {profile.get('MIN_PRICE'):,} – {profile.get('MAX_PRICE'):,} ★\n"
-            f"├📦 <b>Саплай</b>: {profile.get('MIN_SUPPLY'):,} – {profile.get('MAX_SUPPLY'):,}\n"
-            f"├🎁 <b>Куплено</b>: {profile.get('BOUGHT'):,} / {profile.get('COUNT'):,}\n"
-            f"├⭐️ <b>Лимит</b>: {profile.get('SPENT'):,} / {profile.get('LIMIT'):,} ★\n"
-            f"├👤 <b>Получатель</b>: {target_display}\n"
-            f"└📤 <b>Отправитель</b>: {sender}"
-        )
-        lines.append(line)
+        userbot_state_profile = _MUTED if profile['SENDER'] == 'userbot' and (not session_state or userbot.get('ENABLED') == False) else ''
+        lines.append(_SUMMARY_PROFILE_TMPL.format(
+            name=profile_name,
+            userbot_state=userbot_state_profile,
+            state=state_profile,
+            target=target_display,
+            sender=sender,
+            **profile
+        ))
 
     # Баланс основного бота
     lines.append(f"\n💰 <b>Баланс бота</b>: {balance:,} ★")
 
     # Добавляем баланс userbot, если сессия активна
     if session_state:
-        lines.append(
-            f"💰 <b>Баланс юзербота</b>: {userbot_balance:,} ★"
-            f"{' 🔕' if not userbot.get('ENABLED') else ''}"
-        )
+        lines.append(_USERBOT_BALANCE_LINE.format(
+            balance=userbot_balance,
+            muted=_MUTED if not userbot.get('ENABLED') else ''
+        ))
     else:
-        lines.append(
-            f"💰 <b>Баланс юзербота</b>: Не подключён!"
-        )
+        lines.append(_USERBOT_NOT_CONNECTED)
 
     return "\n".join(lines)
 
@@ -351,6 +590,13 @@ def get_target_display(profile: dict, user_id: int) -> str:
     :param user_id: id текущего пользователя
     :return: строка для меню
     """
+    return _target_display(profile, str(user_id))
+
+
+def _target_display(profile: dict, user_id_str: str) -> str:
+    """
+    То же, что get_target_display, но с уже приведённым к строке user_id.
+    """
     target_chat_id = profile.get("TARGET_CHAT_ID")
     target_user_id = profile.get("TARGET_USER_ID")
     target_type = profile.get("TARGET_TYPE")
@@ -359,7 +605,7 @@ def get_target_display(profile: dict, user_id: int) -> str:
             return f"{target_chat_id} (Канал)"
         else:
             return f"{target_chat_id}"
-    elif str(target_user_id) == str(user_id):
+    elif str(target_user_id) == user_id_str:
         return f"<code>{target_user_id}</code> (Вы)"
     else:
         return f"<code>{target_user_id}</code>"
@@ -1,6 +1,16 @@
+# --- Стандартные библиотеки ---
+import time
+import asyncio
+import logging
+
 # --- Внутренние модули ---
 from utils.mockdata import generate_test_gifts
-from services.config import DEV_MODE
+from services.config import DEV_MODE, GIFTS_CACHE_TTL, GIFTS_WATCH_INTERVAL, load_config, worker_wakeup, config_changed
+
+logger = logging.getLogger(__name__)
+
+# Последний ответ getAvailableGifts: общий для всех профилей и каталога
+_gift_cache = {"ts": 0.0, "gifts": None}
 
 def normalize_gift(gift) -> dict:
     """
@@ -19,6 +29,50 @@ def normalize_gift(gift) -> dict:
     }
 
 
+async def get_available_gifts_cached(bot, ttl: float = GIFTS_CACHE_TTL):
+    """
+    Возвращает список подарков из API, переиспользуя ответ младше ttl секунд.
+    Профили одного прохода воркера фильтруют один и тот же список вместо отдельных запросов.
+
+    :param bot: Экземпляр бота aiogram.
+    :param ttl: Максимальный возраст закэшированного ответа в секундах.
+    :return: Список объектов Gift.
+    """
+    now = time.monotonic()
+    if _gift_cache["gifts"] is not None and now - _gift_cache["ts"] < ttl:
+        return _gift_cache["gifts"]
+    api_gifts = await bot.get_available_gifts()
+    _gift_cache["gifts"] = api_gifts.gifts
+    _gift_cache["ts"] = now
+    return api_gifts.gifts
+
+
+async def gifts_watcher(bot, interval: float = GIFTS_WATCH_INTERVAL):
+    """
+    Фоновая задача: следит за списком подарков и будит воркер покупок,
+    только когда набор подарков изменился (новый дроп или подарок снят с продажи).
+    Сам воркер в тихие периоды не перечитывает конфиг и не перебирает профили.
+    Пока бот выключен, список не запрашивается: наблюдатель ждёт следующего изменения конфига.
+    """
+    known_ids = None
+    while True:
+        # Сбрасываем до чтения конфига: включение после этой точки не потеряется
+        config_changed.clear()
+        try:
+            config = await load_config()
+            if not config.get("ACTIVE"):
+                await config_changed.wait()
+                continue
+            gifts = await get_available_gifts_cached(bot)
+            gift_ids = frozenset(gift.id for gift in gifts)
+            if gift_ids != known_ids:
+                known_ids = gift_ids
+                worker_wakeup.set()
+        except Exception as e:
+            logger.error(f"Ошибка в gifts_watcher: {e}")
+        await asyncio.sleep(interval)
+
+
 async def get_filtered_gifts(
     bot, 
     min_price, 
@@ -43,9 +97,9 @@ async def get_filtered_gifts(
     :return: Список словарей с параметрами подарков, отсортированный по цене по убыванию.
     """
     # Получаем, нормализуем и фильтруем подарки из маркета
-    api_gifts = await bot.get_available_gifts()
+    api_gifts = await get_available_gifts_cached(bot)
     filtered = []
-    for gift in api_gifts.gifts:
+    for gift in api_gifts:
         price_ok = min_price <= gift.star_count <= max_price
         # Логика по unlimited
         if unlimited:
@@ -5,7 +5,7 @@ import asyncio
 import logging
 
 # --- Внутренние модули ---
-from services.config import USERBOT_UPDATE_COOLDOWN
+from services.config import USERBOT_UPDATE_COOLDOWN, worker_wakeup
 from services.gifts_bot import get_filtered_gifts
 from services.gifts_userbot import get_userbot_filtered_gifts
 
@@ -34,6 +34,7 @@ async def userbot_gifts_updater(user_id: int, base_interval: int = USERBOT_UPDAT
                 unlimited=False
             )
             last_update_userbot = time.time()
+            worker_wakeup.set()  # Новый список юзербота — воркер пересчитает подходящие подарки
         except Exception as e:
             logger.error(f"Ошибка в userbot_gifts_updater: {e}")
         delay = random.randint(base_interval, base_interval + 10)
@@ -6,6 +6,17 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 # --- Внутренние библиотеки ---
 from services.config import load_config, save_config, get_valid_config, format_config_summary
 
+
+class CB:
+    """
+    callback_data кнопок главного меню — общие для клавиатур и фильтров хендлеров.
+    """
+    MAIN_MENU = "main_menu"
+    HELP = "show_help"
+    BUY_TEST = "buy_test_gift"
+    RESET = "reset_bought"
+    TOGGLE = "toggle_active"
+
 async def update_last_menu_message_id(message_id: int):
     """
     Сохраняет id последнего сообщения с меню в конфиг.
@@ -23,18 +34,18 @@ async def get_last_menu_message_id():
     return config.get("LAST_MENU_MESSAGE_ID")
 
 
-def config_action_keyboard(active: bool) -> InlineKeyboardMarkup:
+def _build_action_keyboard(active: bool) -> InlineKeyboardMarkup:
     """
     Генерирует inline-клавиатуру для меню с действиями.
     """
     toggle_text = "🔴 Выключить" if active else "🟢 Включить"
     return InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text=toggle_text, callback_data="toggle_active"),
+            InlineKeyboardButton(text=toggle_text, callback_data=CB.TOGGLE),
             InlineKeyboardButton(text="✏️ Профили", callback_data="profiles_menu")
         ],
         [
-            InlineKeyboardButton(text="♻️ Сбросить", callback_data="reset_bought"),
+            InlineKeyboardButton(text="♻️ Сбросить", callback_data=CB.RESET),
             InlineKeyboardButton(text="⚙️ Юзербот", callback_data="userbot_menu")
         ],
         [
@@ -43,7 +54,7 @@ def config_action_keyboard(active: bool) -> InlineKeyboardMarkup:
         ],
         [
             InlineKeyboardButton(text="🎏 Каталог", callback_data="catalog"),
-            InlineKeyboardButton(text="❓ Помощь", callback_data="show_help")
+            InlineKeyboardButton(text="❓ Помощь", callback_data=CB.HELP)
         ]
     ])
 
@@ -57,6 +68,57 @@ async def update_menu(bot, chat_id: int, user_id: int, message_id: int):
     await send_menu(bot=bot, chat_id=chat_id, config=config, text=format_config_summary(config, user_id))
 
 
+# Клавиатура меню зависит только от статуса — обе версии строятся один раз
+_ACTION_KEYBOARDS = {
+    True: _build_action_keyboard(True),
+    False: _build_action_keyboard(False)
+}
+
+
+def config_action_keyboard(active: bool) -> InlineKeyboardMarkup:
+    """
+    Возвращает готовую inline-клавиатуру меню для указанного статуса.
+    """
+    return _ACTION_KEYBOARDS[bool(active)]
+
+
+async def refresh_menu_in_place(bot, chat_id: int, user_id: int, message_id: int):
+    """
+    Обновляет текущее меню редактированием на месте.
+    Если меню ещё нет или его нельзя отредактировать — отправляет его заново через update_menu.
+    """
+    config = await get_valid_config(user_id)
+    last_menu_message_id = config.get("LAST_MENU_MESSAGE_ID")
+    if last_menu_message_id:
+        try:
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=last_menu_message_id,
+                text=format_config_summary(config, user_id),
+                reply_markup=config_action_keyboard(config.get("ACTIVE"))
+            )
+            return
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return
+    await update_menu(bot=bot, chat_id=chat_id, user_id=user_id, message_id=message_id)
+
+
+async def edit_to_menu(message, config: dict, text: str) -> bool:
+    """
+    Превращает уже отправленное сообщение в меню: редактирует текст и клавиатуру,
+    удаляет предыдущее меню и запоминает id. Возвращает False, если сообщение нельзя отредактировать.
+    """
+    try:
+        await message.edit_text(text, reply_markup=config_action_keyboard(config.get("ACTIVE")))
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            return False
+    await delete_menu(bot=message.bot, chat_id=message.chat.id, current_message_id=message.message_id)
+    await update_last_menu_message_id(message.message_id)
+    return True
+
+
 async def delete_menu(bot, chat_id: int, current_message_id: int = None):
     """
     Удаляет последнее сообщение с меню, если оно отличается от текущего.
@@ -18,7 +18,7 @@ from pyrogram.errors import (
 )
 
 # --- Внутренние библиотеки ---
-from services.config import get_valid_config, save_config
+from services.config import get_valid_config, save_config, notify_config_changed
 from utils.proxy import get_userbot_proxy
 
 logger = logging.getLogger(__name__)
@@ -291,6 +291,7 @@ async def continue_userbot_signin(message, state):
         config["USERBOT"]["USERNAME"] = me.username
         config["USERBOT"]["ENABLED"] = True
         await save_config(config)
+        notify_config_changed()
         
         return True, False, False  # Успешно, пароль не требуется, не retry
     except PhoneCodeInvalid:
@@ -368,6 +369,7 @@ async def finish_userbot_signin(message, state):
         config["USERBOT"]["USERNAME"] = me.username
         config["USERBOT"]["ENABLED"] = True
         await save_config(config)
+        notify_config_changed()
         return True, False
     except PasswordHashInvalid:
         attempts += 1
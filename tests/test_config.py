@@ -0,0 +1,78 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# --- Внутренние модули ---
+from services import config as cfg
+from services._json import dumps, loads
+
+
+class DeferredWriteTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Отложенная запись config.json: чтение-изменение-запись не теряет снимков,
+    которые ещё не дошли до диска или пишутся прямо сейчас.
+    """
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "config.json")
+        # Состояние модуля привязано к циклу событий — у каждого теста своё
+        cfg._flush_task = None
+        cfg._write_lock = asyncio.Lock()
+        cfg._write_bytes(self.path, dumps({"BALANCE": 0, "ACTIVE": False}))
+
+    async def asyncTearDown(self):
+        if cfg._flush_task is not None:
+            cfg._flush_task.cancel()
+        for store in (cfg._pending_writes, cfg._inflight, cfg._LAST_BYTES, cfg._write_generation):
+            store.pop(self.path, None)
+        self.tmp.cleanup()
+
+    def read_file(self) -> dict:
+        return loads(Path(self.path).read_bytes())
+
+    async def test_read_during_inflight_write_sees_snapshot(self):
+        real_write = cfg._write_bytes
+
+        def slow_write(path, data):
+            time.sleep(0.2)
+            real_write(path, data)
+
+        await cfg.save_config({"BALANCE": 0, "ACTIVE": True}, self.path)
+        with mock.patch.object(cfg, "_write_bytes", slow_write):
+            flush = asyncio.create_task(cfg.flush_config())
+            await asyncio.sleep(0.05)
+            self.assertIn(self.path, cfg._inflight)
+
+            # Изменение баланса посреди записи строится на записываемом снимке, а не на старом файле
+            config = await cfg.load_config(self.path)
+            config["BALANCE"] += 100
+            await cfg.save_config(config, self.path)
+            await flush
+            await cfg.flush_config()
+
+        self.assertEqual(self.read_file(), {"BALANCE": 100, "ACTIVE": True})
+
+    async def test_failed_write_is_retried(self):
+        def failing_write(path, data):
+            raise OSError("disk full")
+
+        await cfg.save_config({"BALANCE": 5, "ACTIVE": False}, self.path)
+        with mock.patch.object(cfg, "_write_bytes", failing_write):
+            await cfg.flush_config()
+        self.assertIn(self.path, cfg._pending_writes)
+
+        # То же содержимое не считается уже записанным и попадает на диск следующим flush
+        await cfg.save_config({"BALANCE": 5, "ACTIVE": False}, self.path)
+        await cfg.flush_config()
+        self.assertEqual(self.read_file(), {"BALANCE": 5, "ACTIVE": False})
+        self.assertNotIn(self.path, cfg._pending_writes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,20 +1,47 @@
 # --- Стандартные библиотеки ---
 from datetime import datetime, timezone
 import re
+import time
 
 PHONE_REGEX = re.compile(r"^\+\d{10,15}$")
 API_HASH_REGEX = re.compile(r"^[a-fA-F0-9]{32}$")
 
+# Строка времени с точностью до секунды: форматируется не чаще раза в секунду
+_now_cache = {"second": None, "text": ""}
+
 def now_str() -> str:
     """
     Возвращает строку с текущим временем в UTC в формате "дд.мм.гггг чч:мм:сс".
+    В пределах одной секунды возвращает уже отформатированную строку.
 
     :return: Строка времени в формате "%d.%m.%Y %H:%M:%S"
     """
-    return datetime.now(timezone.utc).strftime("%d.%m.%Y %H:%M:%S")
+    second = int(time.time())
+    if second != _now_cache["second"]:
+        _now_cache["second"] = second
+        _now_cache["text"] = datetime.fromtimestamp(second, timezone.utc).strftime("%d.%m.%Y %H:%M:%S")
+    return _now_cache["text"]
 
 def is_valid_profile_name(name: str) -> bool:
     """
     Проверяет, что имя профиля состоит только из русских/латинских букв и цифр, длина 1-12 символов.
     """
     return bool(re.fullmatch(r"[А-Яа-яA-Za-z0-9 ()]{1,12}", name))
+
+def parse_positive_int(text: str) -> int | None:
+    """
+    Преобразует строку в положительное целое число без исключений.
+    Возвращает None, если строка не является числом больше нуля.
+    """
+    text = text.strip()
+    if not (text.isascii() and text.isdigit()):
+        return None
+    value = int(text)
+    return value if value > 0 else None
+
+def is_command(text: str | None, command: str) -> bool:
+    """
+    Проверяет, что текст — ровно указанная команда (без учёта регистра).
+    Обычный ввод отсекается по первому символу и длине без создания новых строк.
+    """
+    return bool(text) and text[0] == "/" and len(text) == len(command) and text.lower() == command